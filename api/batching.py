@@ -0,0 +1,100 @@
+# batching.py - Dynamic micro-batching for model inference
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Gathers concurrent requests into one model call.
+
+    Callers block in submit() while a background thread collects up to
+    max_batch_size items, or whatever arrives within max_wait_ms of the
+    first one, runs them through process_batch together and hands each
+    caller its own result.
+    """
+
+    def __init__(self, process_batch, max_batch_size=16, max_wait_ms=5):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = Counter()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def submit(self, item, timeout=None, solo=False):
+        """Queue one item and wait for its result.
+
+        With solo=True the item is processed straight away in the calling
+        thread when no other caller is in flight, since there is nobody to
+        wait for.
+        """
+        with self._lock:
+            self._in_flight += 1
+            alone = self._in_flight == 1
+        try:
+            if solo and alone:
+                result = self.process_batch([item])[0]
+                with self._lock:
+                    self.batch_sizes[1] += 1
+                return result
+            future = Future()
+            self._worker_queue().put((item, future))
+            return future.result(timeout)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _worker_queue(self):
+        # Started lazily so every forked gunicorn worker gets its own thread
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,), daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+            return self._queue
+
+    def _collect(self, pending):
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, pending):
+        while True:
+            batch = self._collect(pending)
+            try:
+                results = self.process_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            with self._lock:
+                self.batch_sizes[len(batch)] += 1
+
+    def stats(self):
+        with self._lock:
+            batches = sum(self.batch_sizes.values())
+            items = sum(size * count for size, count in self.batch_sizes.items())
+            return {
+                'queueDepth': self._queue.qsize() if self._queue else 0,
+                'maxBatchSize': self.max_batch_size,
+                'maxWaitMs': self.max_wait * 1000,
+                'batches': batches,
+                'items': items,
+                'meanBatchSize': round(items / batches, 2) if batches else 0,
+                'batchSizeHistogram': dict(sorted(self.batch_sizes.items()))
+            }
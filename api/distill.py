@@ -0,0 +1,221 @@
+# distill.py - A small CNN text classifier distilled from T5Classifier
+#   python distill.py comments.txt [--epochs 5] [--temperature 2]
+# run where the weights are. The corpus is unlabeled, one comment per line
+# (or JSON lines with a "text" field). T5Classifier labels it, the student
+# learns its class probabilities, and student_text_model.pth plus
+# student_text_model.json (architecture and teacher/student report) are
+# written. TEXT_MODEL=student then serves /api/detect/text from it.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+STUDENT_WEIGHTS = "student_text_model.pth"
+STUDENT_CONFIG = "student_text_model.json"
+
+
+class StudentClassifier(nn.Module):
+    """Token embeddings over the T5 vocabulary, parallel 1-D convolutions
+    and a max over time. Called like T5Classifier, so the tokenizer,
+    padding and batching code serve either one."""
+
+    def __init__(self, vocab_size, embedding_dim=64, filters=128, kernel_sizes=(2, 3, 5), pad_token_id=0):
+        super().__init__()
+        self.embedding = nn.Embedding(vocab_size, embedding_dim, padding_idx=pad_token_id)
+        self.convs = nn.ModuleList(nn.Conv1d(embedding_dim, filters, k, padding=k // 2) for k in kernel_sizes)
+        self.dropout = nn.Dropout(0.2)
+        self.classifier = nn.Linear(filters * len(kernel_sizes), 2)
+
+    def forward(self, input_ids, attention_mask):
+        embedded = self.embedding(input_ids).transpose(1, 2)
+        padding = (attention_mask == 0).unsqueeze(1)
+        pooled = []
+        for conv in self.convs:
+            features = F.relu(conv(embedded))[:, :, :input_ids.shape[1]]
+            pooled.append(features.masked_fill(padding, float("-inf")).max(dim=2).values)
+        return self.classifier(self.dropout(torch.cat(pooled, dim=1)))
+
+
+def load_student_config(path=STUDENT_CONFIG):
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_student(config):
+    return StudentClassifier(**config["architecture"])
+
+
+def read_corpus(path):
+    """Unique non-empty comments from a text or JSON lines file"""
+    texts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                line = json.loads(line).get("text", "").strip()
+            if line:
+                texts.append(line)
+    return list(dict.fromkeys(texts))
+
+
+def length_batches(ids, batch_size, shuffle=False):
+    """Indexes of ids in batches of similar length, so padding stays short"""
+    order = sorted(range(len(ids)), key=lambda i: len(ids[i]))
+    batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+    if shuffle:
+        random.shuffle(batches)
+    return batches
+
+
+def pad(batch_ids, pad_token_id):
+    longest = max(len(ids) for ids in batch_ids)
+    input_ids = torch.full((len(batch_ids), longest), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(batch_ids), longest), dtype=torch.long)
+    for row, ids in enumerate(batch_ids):
+        input_ids[row, :len(ids)] = torch.tensor(ids)
+        attention_mask[row, :len(ids)] = 1
+    return input_ids, attention_mask
+
+
+def logits_of(model, ids, pad_token_id, batch_size=64):
+    """Logits of every token id list, in order"""
+    model.eval()
+    logits = torch.empty(len(ids), 2)
+    with torch.no_grad():
+        for batch in length_batches(ids, batch_size):
+            logits[batch] = model(*pad([ids[i] for i in batch], pad_token_id)).float()
+    return logits
+
+
+def train(student, ids, teacher_logits, pad_token_id, epochs, temperature, batch_size=64, lr=2e-3):
+    """Fit the student to the teacher's temperature-softened class probabilities"""
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr)
+    targets = F.softmax(teacher_logits / temperature, dim=1)
+    for epoch in range(epochs):
+        student.train()
+        total = 0.0
+        for batch in length_batches(ids, batch_size, shuffle=True):
+            outputs = student(*pad([ids[i] for i in batch], pad_token_id))
+            loss = F.kl_div(F.log_softmax(outputs / temperature, dim=1), targets[batch],
+                            reduction="batchmean") * temperature ** 2
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(batch)
+        print(f"epoch {epoch + 1}/{epochs}: distillation loss {total / len(ids):.4f}")
+    student.eval()
+    return student
+
+
+def measure(model, ids, pad_token_id):
+    """Single-text p50 latency, batched throughput and parameter memory"""
+    model.eval()
+    single = []
+    with torch.no_grad():
+        for row in ids[:200]:
+            started = time.perf_counter()
+            model(*pad([row], pad_token_id))
+            single.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        logits_of(model, ids[:1024], pad_token_id)
+        batched = time.perf_counter() - started
+    single.sort()
+    return {
+        "latencyP50Ms": round(single[len(single) // 2] * 1000, 3),
+        "textsPerSecond": round(min(len(ids), 1024) / batched, 1),
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "weightsMB": round(sum(p.numel() * p.element_size() for p in model.parameters()) / 2 ** 20, 1)
+    }
+
+
+def report(teacher, student, eval_ids, holdout, encode, pad_token_id):
+    """Teacher and student side by side: agreement with the teacher on
+    held-back corpus texts, accuracy on the labelled holdout, speed and size"""
+    teacher_probs = F.softmax(logits_of(teacher, eval_ids, pad_token_id), dim=1)
+    student_probs = F.softmax(logits_of(student, eval_ids, pad_token_id), dim=1)
+    agreement = (teacher_probs.argmax(dim=1) == student_probs.argmax(dim=1)).float().mean().item()
+
+    results = {"teacher": measure(teacher, eval_ids, pad_token_id), "student": measure(student, eval_ids, pad_token_id)}
+    results["student"]["teacherAgreement"] = round(agreement, 4)
+    results["student"]["meanProbabilityDiff"] = round((teacher_probs - student_probs)[:, 1].abs().mean().item(), 4)
+    if holdout:
+        holdout_ids = encode([example["text"] for example in holdout])
+        labels = torch.tensor([example["label"] for example in holdout])
+        for name, model in (("teacher", teacher), ("student", student)):
+            predictions = logits_of(model, holdout_ids, pad_token_id).argmax(dim=1)
+            results[name]["holdoutAccuracy"] = round((predictions == labels).float().mean().item(), 4)
+
+    print(f"\n{'':22}{'teacher':>14}{'student':>14}")
+    for key in ("holdoutAccuracy", "teacherAgreement", "latencyP50Ms", "textsPerSecond", "parameters", "weightsMB"):
+        row = [results[name].get(key, "-") for name in ("teacher", "student")]
+        print(f"{key:22}{row[0]:>14}{row[1]:>14}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill T5Classifier into a small CNN text classifier")
+    parser.add_argument("corpus", help="unlabeled comments, one per line or JSON lines with a text field")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--embedding-dim", type=int, default=64)
+    parser.add_argument("--filters", type=int, default=128)
+    parser.add_argument("--eval-fraction", type=float, default=0.1, help="corpus share held back for the report")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    # Import the API without loading its models; the float teacher is built here
+    os.environ["MODEL_LOADING"] = "lazy"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import flask_api
+
+    texts = read_corpus(args.corpus)
+    random.shuffle(texts)
+    tokenizer = flask_api.tokenizer_handle.get()
+    pad_token_id = tokenizer.pad_token_id
+    encode = flask_api.encode_texts
+    split = max(1, int(len(texts) * args.eval_fraction))
+    eval_ids, train_ids = encode(texts[:split]), encode(texts[split:])
+    print(f"{len(train_ids)} training and {len(eval_ids)} evaluation comments from {args.corpus}")
+
+    teacher = flask_api.build_text_model()
+    started = time.perf_counter()
+    teacher_logits = logits_of(teacher, train_ids, pad_token_id)
+    print(f"Teacher labelled the corpus in {time.perf_counter() - started:.1f}s "
+          f"({(teacher_logits.argmax(dim=1) == 1).float().mean().item():.1%} cyberbullying)")
+
+    architecture = {
+        "vocab_size": len(tokenizer),
+        "embedding_dim": args.embedding_dim,
+        "filters": args.filters,
+        "kernel_sizes": [2, 3, 5],
+        "pad_token_id": pad_token_id
+    }
+    student = train(StudentClassifier(**architecture), train_ids, teacher_logits, pad_token_id,
+                    args.epochs, args.temperature)
+
+    holdout = [example for example in flask_api.load_holdout(flask_api.QUANTIZE_HOLDOUT) if "text" in example]
+    results = report(teacher, student, eval_ids, holdout, encode, pad_token_id)
+    torch.save(student.state_dict(), STUDENT_WEIGHTS)
+    with open(STUDENT_CONFIG, "w") as f:
+        json.dump({
+            "architecture": architecture,
+            "teacher": os.path.basename(flask_api.weights_file("text_model.pth")),
+            "corpus": {"path": os.path.abspath(args.corpus), "train": len(train_ids), "eval": len(eval_ids)},
+            "epochs": args.epochs,
+            "temperature": args.temperature,
+            "report": results
+        }, f, indent=2)
+    print(f"\n✅ Student written to {STUDENT_WEIGHTS} and {STUDENT_CONFIG}")
+
+
+if __name__ == "__main__":
+    main()
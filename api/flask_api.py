@@ -2,138 +2,590 @@
 # app.py - Flask API for your PyTorch models
 import torch
 import torch.nn as nn
-from transformers import T5Tokenizer, T5EncoderModel
-import timm
-from PIL import Image
-from torchvision import transforms
+from PIL import Image, UnidentifiedImageError
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import base64
 import io
+import numpy as np
 import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import wraps
+from batching import MicroBatcher
+from distill import STUDENT_WEIGHTS, build_student, load_student_config
+from image_dedupe import PerceptualIndex
+from lazy_loading import LazyModel
+from metrics import batch_size, instrument, registry, stage_seconds
+from minimal_api import cached_detect
+from onnx_runtime import INFERENCE_BACKEND, OnnxModel, load_onnx_model
+from quantization import QUANTIZE, is_quantized, load_holdout, load_model
+from video_scan import sample_frames, scan_video
+from weights import load_weights, weights_file
 
 app = Flask(__name__)
 CORS(app)
+instrument(app)
 
 # Device
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(API_DIR, "model_info.json")) as f:
+    MODEL_INFO = json.load(f)
+TEXT_MAX_LENGTH = MODEL_INFO["text_max_length"]
+
+# The t5-small config and tokenizer ship with the repo, so nothing is
+# fetched from the Hugging Face hub
+T5_CONFIG_DIR = os.path.join(API_DIR, "t5_encoder")
+T5_TOKENIZER_DIR = os.path.join(API_DIR, "t5_tokenizer")
+
 # ========== TEXT MODEL ==========
 class T5Classifier(nn.Module):
     def __init__(self):
         super(T5Classifier, self).__init__()
-        self.encoder = T5EncoderModel.from_pretrained("t5-small")
+        from transformers import T5Config, T5EncoderModel
+        # Encoder weights come from text_model.pth, only the config is needed here
+        self.encoder = T5EncoderModel(T5Config.from_pretrained(T5_CONFIG_DIR))
         self.classifier = nn.Linear(512, 2)
 
     def forward(self, input_ids, attention_mask):
-        outputs = self.encoder(input_ids=input_ids, attention_mask=attention_mask)
-        pooled_output = outputs.last_hidden_state[:, 0, :]
-        logits = self.classifier(pooled_output)
+        with stage_seconds.time(stage="encoder"):
+            outputs = self.encoder(input_ids=input_ids, attention_mask=attention_mask)
+        with stage_seconds.time(stage="classifier_head"):
+            pooled_output = outputs.last_hidden_state[:, 0, :]
+            logits = self.classifier(pooled_output)
         return logits
 
 # ========== IMAGE TRANSFORMS ==========
-image_transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-])
+IMAGE_MEAN = [0.485, 0.456, 0.406]
+IMAGE_STD = [0.229, 0.224, 0.225]
+
+# Same as torchvision Resize((224, 224)) + ToTensor, without importing
+# torchvision (about half of this module's import time)
+def image_to_tensor(image):
+    with stage_seconds.time(stage="image_transform"):
+        image = image.convert("RGB").resize((224, 224), Image.BILINEAR)
+        return torch.from_numpy(np.asarray(image, dtype=np.float32) / 255).permute(2, 0, 1)
+
+# Batched path normalizes once on the stacked batch instead
+def image_transform(image):
+    return (image_to_tensor(image) - torch.tensor(IMAGE_MEAN).view(3, 1, 1)) / torch.tensor(IMAGE_STD).view(3, 1, 1)
+
+# ========== QUANTIZATION CHECKS ==========
+# With QUANTIZE=1, int8 models must keep their accuracy on this held-out set;
+# it has no images yet, so only the text model is quantized
+QUANTIZE_HOLDOUT = os.environ.get("QUANTIZE_HOLDOUT", os.path.join(API_DIR, "quantization_holdout.jsonl"))
+holdout = load_holdout(QUANTIZE_HOLDOUT) if QUANTIZE else []
+
+def text_holdout_errors(model):
+    examples = [example for example in holdout if "text" in example]
+    if not examples:
+        return None
+    correct = 0
+    for start in range(0, len(examples), 32):
+        chunk = examples[start:start + 32]
+        encoding = tokenizer_handle.get()([example["text"] for example in chunk], padding=True, truncation=True,
+                                          max_length=TEXT_MAX_LENGTH, return_tensors="pt")
+        with torch.no_grad():
+            predictions = model(encoding["input_ids"], encoding["attention_mask"]).argmax(dim=1).tolist()
+        correct += sum(prediction == example["label"] for prediction, example in zip(predictions, chunk))
+    return len(examples) - correct, len(examples)
+
+def image_holdout_errors(model):
+    examples = [example for example in holdout if "image" in example]
+    if not examples:
+        return None
+    correct = 0
+    for start in range(0, len(examples), 16):
+        chunk = examples[start:start + 16]
+        images = torch.stack([image_transform(Image.open(example["image"]).convert("RGB")) for example in chunk])
+        with torch.no_grad():
+            predictions = model(images).argmax(dim=1).tolist()
+        correct += sum(prediction == example["label"] for prediction, example in zip(predictions, chunk))
+    return len(examples) - correct, len(examples)
 
 # ========== LOAD MODELS ==========
-print("Loading models...")
-
-# Load text model
-text_model = T5Classifier()
-text_model.load_state_dict(torch.load("text_model.pth", map_location=device))
-text_model.to(device)
-text_model.eval()
-print("✅ Text model loaded")
-
-# Load image model
-image_model = timm.create_model("convnext_tiny", pretrained=False, num_classes=2)
-image_model.load_state_dict(torch.load("image_model.pth", map_location=device))
-image_model.to(device)
-image_model.eval()
-print("✅ Image model loaded")
-
-# Load tokenizer
-tokenizer = T5Tokenizer.from_pretrained("t5-small")
-print("✅ Tokenizer loaded")
+# MODELS selects what this process serves (MODELS=text for a text-only
+# deployment never imports timm or reads image_model.pth). MODEL_LOADING:
+#   eager      - load at import; with gunicorn --preload the master loads
+#                once and forked workers share the weights copy-on-write
+#   background - serve immediately, load in a thread, /api/ready says when
+#   lazy       - load each model on its first request
+ENABLED_MODELS = {name.strip() for name in os.environ.get("MODELS", "text,image").split(",")}
+MODEL_LOADING = os.environ.get("MODEL_LOADING", "eager")
+# TEXT_MODEL=student serves /api/detect/text from the CNN distilled from
+# T5Classifier (see distill.py) instead of T5 itself
+TEXT_MODEL = os.environ.get("TEXT_MODEL", "t5")
+TEXT_MODEL_NAME = "student-CNN" if TEXT_MODEL == "student" else "T5-classifier"
+
+def load_tokenizer():
+    # Fast Rust tokenizer from api/t5_tokenizer
+    from transformers import T5TokenizerFast
+    tokenizer = T5TokenizerFast.from_pretrained(T5_TOKENIZER_DIR)
+    print("✅ Tokenizer loaded")
+    return tokenizer
+
+# Weights come from text_model.safetensors / image_model.safetensors when
+# present (memory-mapped, see weights.py), else from the .pth files
+def build_text_model():
+    model = load_weights(T5Classifier, "text_model.pth", device)
+    model.to(device)
+    model.eval()
+    return model
+
+def build_student_model():
+    config = load_student_config()
+    model = load_weights(lambda: build_student(config), STUDENT_WEIGHTS, device)
+    model.to(device)
+    model.eval()
+    return model
+
+def build_image_model():
+    import timm
+    model = load_weights(lambda: timm.create_model("convnext_tiny", pretrained=False, num_classes=2),
+                         "image_model.pth", device)
+    model.to(device)
+    model.eval()
+    return model
+
+# INFERENCE_BACKEND=onnx serves the ONNX exports (see onnx_runtime.py) on
+# CPU; without a current export a model falls back to PyTorch
+def load_backend_model(pth_path, build_model, holdout_errors):
+    if INFERENCE_BACKEND == "onnx" and device.type == "cpu":
+        model = load_onnx_model(pth_path, weights_file(pth_path))
+        if model is not None:
+            return model
+    return load_model(weights_file(pth_path), build_model, holdout_errors, device, QUANTIZE_HOLDOUT)
+
+def model_backend(model):
+    return "onnx" if isinstance(model, OnnxModel) else "torch"
+
+def load_text_model():
+    tokenizer_handle.get()
+    if TEXT_MODEL == "student":
+        model = load_backend_model(STUDENT_WEIGHTS, build_student_model, text_holdout_errors)
+    else:
+        model = load_backend_model("text_model.pth", build_text_model, text_holdout_errors)
+    print(f"✅ Text model loaded ({model_backend(model)})")
+    return model
+
+def load_image_model():
+    model = load_backend_model("image_model.pth", build_image_model, image_holdout_errors)
+    print(f"✅ Image model loaded ({model_backend(model)})")
+    return model
+
+tokenizer_handle = LazyModel("tokenizer", load_tokenizer, enabled="text" in ENABLED_MODELS)
+text_handle = LazyModel("text", load_text_model, enabled="text" in ENABLED_MODELS)
+image_handle = LazyModel("image", load_image_model, enabled="image" in ENABLED_MODELS)
+MODEL_HANDLES = {"text": text_handle, "image": image_handle}
+
+registry.callback("model_load_seconds", "Time taken to load each model in this process",
+                  lambda: {(name,): handle.load_seconds
+                           for name, handle in {"tokenizer": tokenizer_handle, **MODEL_HANDLES}.items()},
+                  labels=("model",))
+registry.callback("model_ready", "Whether each enabled model is loaded",
+                  lambda: {(name,): int(handle.ready) for name, handle in MODEL_HANDLES.items() if handle.enabled},
+                  labels=("model",))
+
+if MODEL_LOADING == "eager":
+    print("Loading models...")
+    for handle in MODEL_HANDLES.values():
+        if handle.enabled:
+            handle.get()
+elif MODEL_LOADING == "background":
+    for handle in MODEL_HANDLES.values():
+        handle.warm_up()
+
+def requires_models(*names):
+    """Answer 503 when an endpoint needs a model this server does not run"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            disabled = [name for name in names if not MODEL_HANDLES[name].enabled]
+            if disabled:
+                return jsonify({"error": f"{', '.join(disabled)} model not enabled on this server"}), 503
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
 
 # ========== HELPER FUNCTIONS ==========
-def predict_text(text):
-    """Predict if text contains cyberbullying"""
-    if not text or len(text.strip()) < 3:
-        return {"error": "Text too short"}
+# Texts are padded only to the longest text in their length bucket
+TEXT_LENGTH_BUCKETS = [n for n in (8, 16, 32, 64) if n < TEXT_MAX_LENGTH] + [TEXT_MAX_LENGTH]
+TEXT_BUCKET_BATCH_SIZE = int(os.environ.get("TEXT_BUCKET_BATCH_SIZE", "64"))
+# Inputs up to this many tokens skip the batching queue when it is idle
+TEXT_FAST_PATH_TOKENS = int(os.environ.get("TEXT_FAST_PATH_TOKENS", "16"))
+
+def encode_texts(texts):
+    """Token ids of each text, truncated but not padded.
     
-    try:
-        # Tokenize
-        encoding = tokenizer(
-            text,
-            padding="max_length",
-            truncation=True,
-            max_length=128,
-            return_tensors="pt"
-        )
-        
-        input_ids = encoding["input_ids"].to(device)
-        attention_mask = encoding["attention_mask"].to(device)
-        
-        # Predict
-        with torch.no_grad():
-            outputs = text_model(input_ids, attention_mask)
-            probabilities = torch.softmax(outputs, dim=1)
-            prediction = torch.argmax(outputs, dim=1).item()
-            confidence = probabilities[0][prediction].item()
-        
-        return {
+    The whole list is encoded in one call so the Rust tokenizer can work
+    through it in parallel.
+    """
+    tokenizer = tokenizer_handle.get()
+    with stage_seconds.time(stage="tokenize"):
+        return tokenizer(texts, truncation=True, max_length=TEXT_MAX_LENGTH)["input_ids"]
+
+def forward_token_ids(batch_ids):
+    """Class probabilities for token id lists, padded to the longest one"""
+    batch_size.observe(len(batch_ids), kind="text")
+    longest = max(len(ids) for ids in batch_ids)
+    input_ids = torch.full((len(batch_ids), longest), tokenizer_handle.get().pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(batch_ids), longest), dtype=torch.long)
+    for row, ids in enumerate(batch_ids):
+        input_ids[row, :len(ids)] = torch.tensor(ids)
+        attention_mask[row, :len(ids)] = 1
+    
+    input_ids = input_ids.to(device)
+    attention_mask = attention_mask.to(device)
+    
+    with torch.no_grad(), stage_seconds.time(stage="text_forward"):
+        outputs = text_handle.get()(input_ids, attention_mask)
+        return torch.softmax(outputs, dim=1).tolist()
+
+def predict_encoded(items):
+    """Predict (text, token ids) pairs, batching texts of similar length together"""
+    buckets = {}
+    for index, (_, ids) in enumerate(items):
+        bucket = next(size for size in TEXT_LENGTH_BUCKETS if len(ids) <= size)
+        buckets.setdefault(bucket, []).append(index)
+    
+    probabilities = [None] * len(items)
+    for indexes in buckets.values():
+        for start in range(0, len(indexes), TEXT_BUCKET_BATCH_SIZE):
+            chunk = indexes[start:start + TEXT_BUCKET_BATCH_SIZE]
+            for index, probs in zip(chunk, forward_token_ids([items[i][1] for i in chunk])):
+                probabilities[index] = probs
+    
+    results = []
+    for (text, _), probs in zip(items, probabilities):
+        prediction = probs.index(max(probs))
+        confidence = probs[prediction]
+        results.append({
             "isCyberbullying": bool(prediction == 1),
             "score": float(confidence),
             "prediction": "cyberbullying" if prediction == 1 else "non_cyberbullying",
             "confidence": float(confidence),
             "text_length": len(text)
+        })
+    return results
+
+# Concurrent predict_text calls share forward passes (needs a threaded server)
+TEXT_BATCHING = os.environ.get("TEXT_BATCHING", "1") == "1"
+text_batcher = MicroBatcher(
+    predict_encoded,
+    max_batch_size=int(os.environ.get("TEXT_BATCH_MAX_SIZE", "16")),
+    max_wait_ms=float(os.environ.get("TEXT_BATCH_MAX_WAIT_MS", "5"))
+)
+
+registry.callback("text_batcher_queue_depth", "Texts waiting for the micro-batcher",
+                  lambda: text_batcher.stats()["queueDepth"] if TEXT_BATCHING else None)
+
+# Texts longer than TEXT_MAX_LENGTH tokens are read in overlapping windows,
+# TEXT_WINDOW_BATCH windows per forward, until one scores above
+# TEXT_WINDOW_THRESHOLD; the windows after that batch are never computed
+TEXT_WINDOW_OVERLAP = int(os.environ.get("TEXT_WINDOW_OVERLAP", "32"))
+TEXT_WINDOW_BATCH = int(os.environ.get("TEXT_WINDOW_BATCH", "4"))
+TEXT_WINDOW_THRESHOLD = float(os.environ.get("TEXT_WINDOW_THRESHOLD", "0.5"))
+# Bounds the work for one request; text past the last window is not read
+TEXT_MAX_WINDOWS = int(os.environ.get("TEXT_MAX_WINDOWS", "64"))
+text_windows = registry.counter("text_windows_total", "Long-text windows computed or skipped by early exit",
+                                ("result",))
+
+def encode_windows(text):
+    """(token ids, start char, end char) of each window of text, and
+    whether TEXT_MAX_WINDOWS cut it short.
+    
+    The first window is exactly what encode_texts() gives, so a text that
+    fits in one window is treated as before.
+    """
+    tokenizer = tokenizer_handle.get()
+    with stage_seconds.time(stage="tokenize"):
+        encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    ids, offsets = encoding["input_ids"], encoding["offset_mapping"]
+    body = TEXT_MAX_LENGTH - 1  # leaves room for </s>
+    stride = body - TEXT_WINDOW_OVERLAP
+    starts = range(0, max(len(ids) - TEXT_WINDOW_OVERLAP, 1), stride)
+    windows = []
+    for start in starts[:TEXT_MAX_WINDOWS]:
+        chunk = ids[start:start + body]
+        span = (offsets[start][0], offsets[start + len(chunk) - 1][1]) if chunk else (0, 0)
+        windows.append((chunk + [tokenizer.eos_token_id], *span))
+    return windows, len(starts) > TEXT_MAX_WINDOWS
+
+def predict_windows(text, windows, truncated):
+    """Predict a long text from its windows, stopping at the first forward
+    that flags one. Its score is the first flagged window's, or the most
+    toxic window's if none is flagged."""
+    probabilities = []
+    triggered = None
+    for start in range(0, len(windows), TEXT_WINDOW_BATCH):
+        probabilities += forward_token_ids([ids for ids, _, _ in windows[start:start + TEXT_WINDOW_BATCH]])
+        triggered = next((i for i in range(start, len(probabilities))
+                          if probabilities[i][1] > TEXT_WINDOW_THRESHOLD), None)
+        if triggered is not None:
+            break
+    text_windows.inc(len(probabilities), result="computed")
+    text_windows.inc(len(windows) - len(probabilities), result="skipped")
+    
+    worst = triggered if triggered is not None else max(range(len(probabilities)), key=lambda i: probabilities[i][1])
+    probs = probabilities[worst]
+    flagged = triggered is not None
+    confidence = probs[1] if flagged else probs[0]
+    return {
+        "isCyberbullying": flagged,
+        "score": float(confidence),
+        "prediction": "cyberbullying" if flagged else "non_cyberbullying",
+        "confidence": float(confidence),
+        "text_length": len(text),
+        "windows": {
+            "total": len(windows),
+            "computed": len(probabilities),
+            "truncated": truncated,
+            "triggeredBy": {
+                "index": triggered,
+                "start": windows[triggered][1],
+                "end": windows[triggered][2],
+                "score": float(probs[1])
+            } if flagged else None
         }
+    }
+
+def predict_text(text):
+    """Predict if text contains cyberbullying"""
+    if not text or len(text.strip()) < 3:
+        return {"error": "Text too short"}
+    
+    try:
+        windows, truncated = encode_windows(text)
+        if len(windows) > 1:
+            return predict_windows(text, windows, truncated)
+        ids = windows[0][0]
+        if TEXT_BATCHING:
+            return text_batcher.submit((text, ids), solo=len(ids) <= TEXT_FAST_PATH_TOKENS)
+        return predict_encoded([(text, ids)])[0]
         
     except Exception as e:
         return {"error": str(e)}
 
+# Uploads are rejected on byte size, then on pixel count read from the header
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(40_000_000)))
+IMAGE_SIZE = MODEL_INFO["image_size"]
+
+class ImageTooLarge(ValueError):
+    pass
+
+def open_image(fp):
+    """Open an image for the model, decoding no more pixels than it needs.
+    
+    Only the header is read before the size check. JPEGs are decoded in
+    draft mode at the smallest DCT scale that still covers IMAGE_SIZE.
+    """
+    with stage_seconds.time(stage="image_decode"):
+        image = Image.open(fp)
+        width, height = image.size
+        if width * height > MAX_IMAGE_PIXELS:
+            raise ImageTooLarge(f"Image too large ({width}x{height})")
+        image.draft("RGB", (IMAGE_SIZE, IMAGE_SIZE))
+        return image.convert("RGB")
+
+IMAGE_BATCH_SIZE = int(os.environ.get("IMAGE_BATCH_SIZE", "32"))
+MAX_IMAGES_PER_REQUEST = int(os.environ.get("MAX_IMAGES_PER_REQUEST", "64"))
+decode_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("IMAGE_DECODE_WORKERS", "4")))
+image_mean = torch.tensor(IMAGE_MEAN, device=device).view(1, 3, 1, 1)
+image_std = torch.tensor(IMAGE_STD, device=device).view(1, 3, 1, 1)
+
+def classify_image_tensors(tensors):
+    """Predict unnormalized 3x224x224 image tensors, IMAGE_BATCH_SIZE per forward"""
+    results = []
+    for start in range(0, len(tensors), IMAGE_BATCH_SIZE):
+        batch = torch.stack(tensors[start:start + IMAGE_BATCH_SIZE]).to(device)
+        batch = (batch - image_mean) / image_std
+        batch_size.observe(len(batch), kind="image")
+        
+        with torch.no_grad(), stage_seconds.time(stage="image_forward"):
+            outputs = image_handle.get()(batch)
+            probabilities = torch.softmax(outputs, dim=1)
+            predictions = torch.argmax(outputs, dim=1)
+        
+        for prediction, probs in zip(predictions.tolist(), probabilities.tolist()):
+            confidence = probs[prediction]
+            results.append({
+                "isCyberbullying": bool(prediction == 1),
+                "score": float(confidence),
+                "prediction": "cyberbullying" if prediction == 1 else "non_cyberbullying",
+                "confidence": float(confidence)
+            })
+    return results
+
+# With IMAGE_DEDUPE=1, re-uploads of an image this worker has already
+# classified (same decoded pixels) are answered without a model forward.
+# IMAGE_DEDUPE_MAX_DISTANCE > 0 also reuses verdicts for perceptually
+# similar images, which is unsafe for captioned images: see image_dedupe.py
+IMAGE_DEDUPE = os.environ.get("IMAGE_DEDUPE", "0") == "1"
+image_index = PerceptualIndex(
+    max_distance=int(os.environ.get("IMAGE_DEDUPE_MAX_DISTANCE", "0")),
+    maxsize=int(os.environ.get("IMAGE_DEDUPE_SIZE", "50000")),
+    hash_function=os.environ.get("IMAGE_DEDUPE_HASH", "dhash")
+) if IMAGE_DEDUPE else None
+
+def classify_images(images):
+    """Predict decoded RGB images, repeats of earlier ones from image_index"""
+    results = [None] * len(images)
+    keys = [None] * len(images)
+    if image_index:
+        with stage_seconds.time(stage="image_hash"):
+            keys = [image_index.fingerprint(image) for image in images]
+        for i, key in enumerate(keys):
+            hit = image_index.lookup(key)
+            if hit:
+                results[i] = {**hit[0], "nearDuplicateDistance": hit[1]}
+    
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        tensors = list(decode_pool.map(image_to_tensor, [images[i] for i in misses]))
+        for i, result in zip(misses, classify_image_tensors(tensors)):
+            results[i] = result
+            if image_index:
+                image_index.add(keys[i], dict(result))
+    return results
+
+if image_index:
+    registry.callback("image_dedupe_lookups_total", "Perceptual-hash index lookups",
+                      lambda: {("hit",): image_index.hits, ("miss",): image_index.misses},
+                      labels=("result",), kind="counter")
+    registry.callback("image_dedupe_entries", "Images held in the perceptual-hash index",
+                      lambda: image_index.stats()["size"])
+
+def predict_image(image):
+    """Predict if a decoded RGB image contains cyberbullying"""
+    return classify_images([image])[0]
+
 def predict_image_base64(image_base64):
     """Predict if image contains cyberbullying from base64"""
     try:
         # Decode base64
         image_data = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(image_data)).convert("RGB")
-        
-        # Transform
-        image_tensor = image_transform(image).unsqueeze(0).to(device)
-        
-        # Predict
-        with torch.no_grad():
-            outputs = image_model(image_tensor)
-            probabilities = torch.softmax(outputs, dim=1)
-            prediction = torch.argmax(outputs, dim=1).item()
-            confidence = probabilities[0][prediction].item()
-        
-        return {
-            "isCyberbullying": bool(prediction == 1),
-            "score": float(confidence),
-            "prediction": "cyberbullying" if prediction == 1 else "non_cyberbullying",
-            "confidence": float(confidence)
-        }
+        return predict_image(open_image(io.BytesIO(image_data)))
         
     except Exception as e:
         return {"error": str(e)}
 
+# Videos are given as uploads or as paths under VIDEO_DIR; the rest are
+# defaults each request may override
+VIDEO_DIR = os.path.realpath(os.environ.get("VIDEO_DIR", os.path.join(API_DIR, "videos")))
+VIDEO_DEFAULTS = {
+    "fps": float(os.environ.get("VIDEO_SAMPLE_FPS", "1")),
+    "sceneThreshold": float(os.environ["VIDEO_SCENE_THRESHOLD"]) if "VIDEO_SCENE_THRESHOLD" in os.environ else None,
+    "keyframesOnly": os.environ.get("VIDEO_KEYFRAMES_ONLY", "0") == "1",
+    "flagThreshold": float(os.environ.get("VIDEO_FLAG_THRESHOLD", "0.5")),
+    "stopConfidence": float(os.environ.get("VIDEO_STOP_CONFIDENCE", "0.95"))
+}
+
+def predict_video(path, options):
+    """Sample frames from a video file and aggregate them into one verdict"""
+    settings = {**VIDEO_DEFAULTS, **{k: v for k, v in options.items() if k in VIDEO_DEFAULTS}}
+    frames = sample_frames(
+        path,
+        fps=float(settings["fps"]),
+        scene_threshold=settings["sceneThreshold"],
+        keyframes_only=bool(settings["keyframesOnly"]),
+        size=IMAGE_SIZE
+    )
+    return scan_video(
+        frames,
+        classify_images,
+        batch_size=IMAGE_BATCH_SIZE,
+        flag_threshold=float(settings["flagThreshold"]),
+        stop_confidence=float(settings["stopConfidence"])
+    )
+
+# Rule scores at or below CASCADE_LOW are clean and above CASCADE_HIGH are
+# toxic without consulting the model; only the band in between reaches T5
+CASCADE_LOW = float(os.environ.get("CASCADE_LOW", "0.2"))
+CASCADE_HIGH = float(os.environ.get("CASCADE_HIGH", "0.8"))
+
+def predict_cascade(text):
+    """Rule engine first, T5 model only for texts the rules are unsure about"""
+    rules = cached_detect(text)
+    result = {
+        "rules": {
+            "score": rules["score"],
+            "severity": rules["severity"],
+            "categories": rules["categories"]
+        }
+    }
+    
+    if CASCADE_LOW < rules["score"] <= CASCADE_HIGH:
+        model = predict_text(text)
+        if "error" not in model:
+            # Model score is the confidence of its prediction, not P(cyberbullying)
+            score = model["score"] if model["isCyberbullying"] else 1 - model["score"]
+            result.update({
+                "stage": "model",
+                "isCyberbullying": model["isCyberbullying"],
+                "score": float(score),
+                "model": model
+            })
+            return result
+        # Model failed, fall back to the rule verdict
+        result["model"] = model
+    
+    result.update({
+        "stage": "rules",
+        "isCyberbullying": rules["isToxic"],
+        "score": rules["score"]
+    })
+    return result
+
+# /api/detect/both runs its text and image branches side by side; torch
+# releases the GIL during forward passes
+inference_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("INFERENCE_POOL_WORKERS", "4")))
+BRANCH_TIMEOUTS = {
+    "text": float(os.environ.get("TEXT_BRANCH_TIMEOUT", "5")),
+    "image": float(os.environ.get("IMAGE_BRANCH_TIMEOUT", "10"))
+}
+
 # ========== API ENDPOINTS ==========
 @app.route('/api/health', methods=['GET'])
 def health():
     return jsonify({
         "status": "healthy",
-        "models_loaded": True,
+        "models_loaded": models_ready(),
+        "models": {name: handle.status() for name, handle in MODEL_HANDLES.items()},
+        "modelLoading": MODEL_LOADING,
+        "textModel": TEXT_MODEL_NAME,
         "device": str(device),
-        "endpoints": ["/api/detect/text", "/api/detect/image", "/api/detect/both"]
+        "backend": {
+            name: model_backend(handle.peek()) if handle.ready else None
+            for name, handle in MODEL_HANDLES.items()
+        },
+        "quantized": {
+            name: is_quantized(handle.peek()) if handle.ready and model_backend(handle.peek()) == "torch" else None
+            for name, handle in MODEL_HANDLES.items()
+        },
+        "endpoints": [
+            "/api/detect/text", "/api/detect/image", "/api/detect/image/upload", "/api/detect/images",
+            "/api/detect/video", "/api/detect/both", "/api/detect/cascade", "/api/ready", "/metrics"
+        ],
+        "textBatching": text_batcher.stats() if TEXT_BATCHING else None,
+        "imageDedupe": image_index.stats() if image_index else None
     })
 
+def models_ready():
+    return all(handle.ready for handle in MODEL_HANDLES.values() if handle.enabled)
+
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 503 until every enabled model is loaded"""
+    body = {"ready": models_ready(), "models": {name: handle.state for name, handle in MODEL_HANDLES.items()}}
+    return jsonify(body), 200 if body["ready"] else 503
+
 @app.route('/api/detect/text', methods=['POST'])
+@requires_models("text")
 def detect_text():
     try:
         data = request.json
@@ -150,13 +602,14 @@ def detect_text():
         return jsonify({
             "success": True,
             **result,
-            "model": "T5-classifier"
+            "model": TEXT_MODEL_NAME
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/detect/image', methods=['POST'])
+@requires_models("image")
 def detect_image():
     try:
         data = request.json
@@ -179,6 +632,139 @@ def detect_image():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/detect/image/upload', methods=['POST'])
+@requires_models("image")
+def detect_image_upload():
+    """Image as multipart field 'image' or as the raw request body (no base64)"""
+    try:
+        if request.content_length is not None and request.content_length > MAX_IMAGE_BYTES:
+            return jsonify({"error": "Image too large"}), 413
+        
+        if request.mimetype == "multipart/form-data":
+            upload = request.files.get("image")
+            if upload is None:
+                return jsonify({"error": "No image provided"}), 400
+            fp = upload.stream
+        else:
+            data = request.stream.read(MAX_IMAGE_BYTES + 1)
+            if not data:
+                return jsonify({"error": "No image provided"}), 400
+            if len(data) > MAX_IMAGE_BYTES:
+                return jsonify({"error": "Image too large"}), 413
+            fp = io.BytesIO(data)
+        
+        try:
+            image = open_image(fp)
+        except ImageTooLarge as e:
+            return jsonify({"error": str(e)}), 413
+        except UnidentifiedImageError:
+            return jsonify({"error": "Unrecognized image format"}), 400
+        
+        return jsonify({
+            "success": True,
+            **predict_image(image),
+            "model": "ConvNeXt-Tiny"
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/detect/images', methods=['POST'])
+@requires_models("image")
+def detect_images():
+    """Many images in one request: multipart 'images' files or JSON {"images": [base64, ...]}"""
+    try:
+        if request.content_length is not None and request.content_length > MAX_IMAGE_BYTES * MAX_IMAGES_PER_REQUEST:
+            return jsonify({"error": "Request too large"}), 413
+        
+        if request.mimetype == "multipart/form-data":
+            sources = [upload.stream for upload in request.files.getlist("images")]
+            load = open_image
+        else:
+            sources = request.json.get('images', [])
+            load = lambda image_base64: open_image(io.BytesIO(base64.b64decode(image_base64)))
+        
+        if not sources or not isinstance(sources, list):
+            return jsonify({"error": "No images provided"}), 400
+        
+        if len(sources) > MAX_IMAGES_PER_REQUEST:
+            return jsonify({"error": f"Too many images (max {MAX_IMAGES_PER_REQUEST})"}), 413
+        
+        # Decode in parallel; one bad image only fails its own entry
+        def preprocess(source):
+            try:
+                return load(source), None
+            except Exception as e:
+                return None, str(e)
+        
+        prepared = list(decode_pool.map(preprocess, sources))
+        predictions = iter(classify_images([image for image, _ in prepared if image is not None]))
+        
+        results = []
+        for index, (image, error) in enumerate(prepared):
+            results.append({"index": index, **(next(predictions) if image is not None else {"error": error})})
+        
+        return jsonify({
+            "success": True,
+            "count": len(results),
+            "results": results,
+            "model": "ConvNeXt-Tiny"
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/detect/video', methods=['POST'])
+@requires_models("image")
+def detect_video():
+    """Video as multipart field 'video', or JSON {"path": ...} relative to VIDEO_DIR"""
+    try:
+        if request.mimetype == "multipart/form-data":
+            upload = request.files.get("video")
+            if upload is None:
+                return jsonify({"error": "No video provided"}), 400
+            options = {k: json.loads(v) for k, v in request.form.items()}
+            
+            # The decoder needs a seekable file, so the upload is spooled to disk
+            with tempfile.NamedTemporaryFile(suffix=os.path.splitext(upload.filename or "")[1]) as f:
+                upload.save(f)
+                f.flush()
+                result = predict_video(f.name, options)
+        else:
+            options = request.json
+            path = os.path.realpath(os.path.join(VIDEO_DIR, options.get("path", "")))
+            if not path.startswith(VIDEO_DIR + os.sep) or not os.path.isfile(path):
+                return jsonify({"error": "Video not found"}), 404
+            result = predict_video(path, options)
+        
+        return jsonify({
+            "success": True,
+            **result,
+            "model": "ConvNeXt-Tiny"
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/detect/cascade', methods=['POST'])
+@requires_models("text")
+def detect_cascade():
+    try:
+        data = request.json
+        text = data.get('text', '')
+        
+        if not text:
+            return jsonify({"error": "No text provided"}), 400
+        
+        return jsonify({
+            "success": True,
+            **predict_cascade(text),
+            "band": [CASCADE_LOW, CASCADE_HIGH]
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/detect/both', methods=['POST'])
 def detect_both():
     try:
@@ -186,29 +772,45 @@ def detect_both():
         text = data.get('text', '')
         image_base64 = data.get('image', '')
         
-        results = {}
+        started = time.monotonic()
+        futures = {}
+        
+        for name, value in (("text", text), ("image", image_base64)):
+            if value and not MODEL_HANDLES[name].enabled:
+                return jsonify({"error": f"{name} model not enabled on this server"}), 503
         
         if text:
-            text_result = predict_text(text)
-            results["text"] = text_result
+            futures["text"] = inference_pool.submit(predict_text, text)
             
         if image_base64:
-            image_result = predict_image_base64(image_base64)
-            results["image"] = image_result
+            futures["image"] = inference_pool.submit(predict_image_base64, image_base64)
+        
+        # A branch that misses its deadline is reported as timed out and the
+        # response carries whatever the other branch produced
+        results = {}
+        for name, future in futures.items():
+            remaining = BRANCH_TIMEOUTS[name] - (time.monotonic() - started)
+            try:
+                results[name] = future.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                results[name] = {"error": f"{name} detection timed out", "timedOut": True}
         
         # Combined decision logic
         if "text" in results and "image" in results:
-            # Simple average of scores
-            text_score = results["text"].get("score", 0) if results["text"].get("isCyberbullying", False) else 0
-            image_score = results["image"].get("score", 0) if results["image"].get("isCyberbullying", False) else 0
+            # Simple average of the scores of the branches that answered
+            branch_scores = [
+                result.get("score", 0) if result.get("isCyberbullying", False) else 0
+                for result in (results["text"], results["image"]) if "error" not in result
+            ]
             
-            combined_score = (text_score + image_score) / 2
+            combined_score = sum(branch_scores) / len(branch_scores) if branch_scores else 0
             combined_prediction = combined_score > 0.5
             
             results["combined"] = {
                 "isCyberbullying": combined_prediction,
                 "score": combined_score,
-                "prediction": "cyberbullying" if combined_prediction else "non_cyberbullying"
+                "prediction": "cyberbullying" if combined_prediction else "non_cyberbullying",
+                "partial": len(branch_scores) < 2
             }
         
         return jsonify({
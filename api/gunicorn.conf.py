@@ -0,0 +1,29 @@
+# gunicorn.conf.py - Serving flask_api with shared, preloaded model weights
+#   gunicorn -c gunicorn.conf.py flask_api:app
+import gc
+import os
+
+# The master imports flask_api and loads the models once; workers are
+# forked afterwards and share the weights copy-on-write instead of each
+# loading its own copy
+preload_app = True
+os.environ.setdefault("MODEL_LOADING", "eager")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+
+
+def pre_fork(server, worker):
+    # Keep the garbage collector from touching (and so copying) the pages
+    # holding objects created while loading the models
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Split the cores between workers rather than have every worker's
+    # torch thread pool claim all of them
+    import torch
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
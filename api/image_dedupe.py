@@ -0,0 +1,149 @@
+# image_dedupe.py - Verdicts for images seen before: exact re-uploads, and
+# optionally near-duplicates by perceptual hash
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# DCT-II basis for pHash's 32x32 thumbnail
+_DCT = np.cos(np.pi * np.outer(np.arange(32), 2 * np.arange(32) + 1) / 64)
+
+# Hashes with fewer than this many bits set, or unset, come from
+# near-uniform thumbnails (flat colours, blank frames) and say nothing
+# about the picture
+MIN_HASH_BITS = 8
+
+
+def _to_int(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(image):
+    """64-bit difference hash: is each pixel of a 9x8 grayscale thumbnail
+    brighter than its right-hand neighbour"""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    return _to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image):
+    """64-bit DCT hash: the lowest 8x8 frequencies of a 32x32 thumbnail
+    against their median. Slower than dhash, steadier under re-encoding"""
+    pixels = np.asarray(image.convert("L").resize((32, 32), Image.BILINEAR), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8].ravel()
+    return _to_int(low > np.median(low[1:]))
+
+
+HASH_FUNCTIONS = {"dhash": dhash, "phash": phash}
+
+
+def pixel_digest(image):
+    """SHA-256 of an image's decoded pixels, mode and size"""
+    digest = hashlib.sha256(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.digest()
+
+
+def is_degenerate(key):
+    return not MIN_HASH_BITS <= key.bit_count() <= 64 - MIN_HASH_BITS
+
+
+class PerceptualIndex:
+    """Values stored under the pixel digest of an image, and found again for
+    the same pixels or, with max_distance > 0, for any image whose 64-bit
+    perceptual hash is within max_distance bits.
+
+    A 64-bit thumbnail hash cannot see overlaid text: the same meme
+    template with a harmless and a hateful caption hashes alike. So
+    max_distance defaults to 0, where only identical pixels share a value,
+    and near-duplicate matching is for deployments whose images carry no
+    captions. Degenerate hashes never take part in it.
+
+    Multi-index hashing: the hash is cut into max_distance + 1 bands, and two
+    hashes at most max_distance bits apart agree exactly on at least one
+    band, so a lookup is one dict probe per band plus a popcount per
+    candidate. Entries are cheap to remove, so the index is an LRU capped
+    at maxsize entries.
+    """
+
+    def __init__(self, max_distance=0, maxsize=50000, hash_function="dhash"):
+        if not 0 <= max_distance <= 15:
+            raise ValueError("max_distance must be between 0 and 15 bits")
+        self.hash = HASH_FUNCTIONS[hash_function]
+        self.hash_function = hash_function
+        self.max_distance = max_distance
+        self.maxsize = maxsize
+        bounds = np.linspace(0, 64, max_distance + 2).astype(int).tolist()
+        self._bands = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self._tables = [{} for _ in self._bands]
+        # digest -> (perceptual hash or None, value)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, image):
+        """(pixel digest, perceptual hash) of an image; the hash is None when
+        it would not be used"""
+        key = self.hash(image) if self.max_distance else None
+        return pixel_digest(image), None if key is None or is_degenerate(key) else key
+
+    def _band_keys(self, key):
+        return [(key >> start) & mask for start, mask in self._bands]
+
+    def lookup(self, fingerprint):
+        """(value, distance) of the stored image with the same pixels
+        (distance 0) or the closest perceptual hash, or None"""
+        digest, key = fingerprint
+        with self._lock:
+            best, best_distance = (digest, 0) if digest in self._entries else (None, None)
+            if best is None and key is not None:
+                for table, band in zip(self._tables, self._band_keys(key)):
+                    for candidate in table.get(band, ()):
+                        distance = (self._entries[candidate][0] ^ key).bit_count()
+                        if distance <= self.max_distance and (best is None or distance < best_distance):
+                            best, best_distance = candidate, distance
+
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best)
+            return self._entries[best][1], best_distance
+
+    def _unlink(self, digest, key):
+        if key is None:
+            return
+        for table, band in zip(self._tables, self._band_keys(key)):
+            table[band].discard(digest)
+            if not table[band]:
+                del table[band]
+
+    def add(self, fingerprint, value):
+        digest, key = fingerprint
+        with self._lock:
+            if digest in self._entries:
+                self._unlink(digest, self._entries[digest][0])
+            if key is not None:
+                for table, band in zip(self._tables, self._band_keys(key)):
+                    table.setdefault(band, set()).add(digest)
+            self._entries[digest] = (key, value)
+            self._entries.move_to_end(digest)
+
+            while len(self._entries) > self.maxsize:
+                evicted, (evicted_key, _) = self._entries.popitem(last=False)
+                self._unlink(evicted, evicted_key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hash": self.hash_function if self.max_distance else "sha256",
+                "maxDistance": self.max_distance,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 3) if lookups else 0
+            }
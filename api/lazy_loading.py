@@ -0,0 +1,78 @@
+# lazy_loading.py - Models loaded on first use, in the background, or up front
+import os
+import threading
+import time
+
+
+class ModelUnavailable(RuntimeError):
+    pass
+
+
+class LazyModel:
+    """Handle for a model that is loaded at most once per process.
+
+    get() loads the model on first use and blocks concurrent callers until
+    it is ready; warm_up() does the same from a background thread. A
+    disabled handle never loads and raises ModelUnavailable instead.
+    """
+
+    def __init__(self, name, loader, enabled=True):
+        self.name = name
+        self.loader = loader
+        self.enabled = enabled
+        self.state = "not_loaded" if enabled else "disabled"
+        self.error = None
+        self.load_seconds = None
+        self._value = None
+        self._lock = threading.Lock()
+        # A fork during a background load leaves the lock held by a thread
+        # that does not exist in the child
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        if self.state == "loading":
+            self.state = "not_loaded"
+
+    def get(self):
+        if self._value is not None:
+            return self._value
+        if not self.enabled:
+            raise ModelUnavailable(f"{self.name} model is not enabled on this server")
+
+        with self._lock:
+            if self._value is None:
+                self.state = "loading"
+                started = time.monotonic()
+                try:
+                    value = self.loader()
+                except Exception as e:
+                    self.state = "failed"
+                    self.error = str(e)
+                    raise
+                self.load_seconds = round(time.monotonic() - started, 2)
+                self.error = None
+                self._value = value
+                self.state = "ready"
+        return self._value
+
+    def peek(self):
+        """The model if it is already loaded, without loading it"""
+        return self._value
+
+    def warm_up(self):
+        if self.enabled:
+            threading.Thread(target=self._warm_up, daemon=True).start()
+
+    def _warm_up(self):
+        try:
+            self.get()
+        except Exception as e:
+            print(f"Error loading {self.name} model: {str(e)}")
+
+    @property
+    def ready(self):
+        return self._value is not None
+
+    def status(self):
+        return {"state": self.state, "loadSeconds": self.load_seconds, "error": self.error}
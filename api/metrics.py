@@ -0,0 +1,218 @@
+# metrics.py - Request, stage and model metrics in the Prometheus text format
+# Values live in process memory, so each web worker reports its own; scrape
+# workers individually or sum the series per instance.
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1000, 2000, 5000, 10000)
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        """(suffix, label pairs, value) for every series"""
+        with self._lock:
+            return [('', tuple(zip(self.labels, key)), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for suffix, pairs, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(pairs)} {_format_value(value)}')
+        return lines
+
+
+class CounterMetric(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class HistogramMetric(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                pairs = tuple(zip(self.labels, key))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append(('_bucket', pairs + (('le', _format_value(bound)),), cumulative))
+                samples.append(('_bucket', pairs + (('le', '+Inf'),), count))
+                samples.append(('_sum', pairs, total))
+                samples.append(('_count', pairs, count))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """Read at scrape time from read(), which returns a number or a dict
+    of label-value tuples to numbers"""
+
+    def __init__(self, name, help, read, labels=(), kind='gauge'):
+        super().__init__(name, help, labels)
+        self.read = read
+        self.kind = kind
+
+    def samples(self):
+        values = self.read()
+        if values is None:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [('', tuple(zip(self.labels, key)), value) for key, value in values.items() if value is not None]
+
+
+class MetricsRegistry:
+    """Metrics by name; asking for an existing name returns the same metric,
+    so modules loaded into one process can share series"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name, create):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = create()
+            return self._metrics[name]
+
+    def counter(self, name, help, labels=()):
+        return self._get_or_create(name, lambda: CounterMetric(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(name, lambda: HistogramMetric(name, help, labels, buckets))
+
+    def callback(self, name, help, read, labels=(), kind='gauge'):
+        return self._get_or_create(name, lambda: CallbackMetric(name, help, read, labels, kind))
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"Error reading metric {metric.name}: {str(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram('stage_duration_seconds', 'Time spent in each processing stage', ('stage',))
+batch_size = registry.histogram('batch_size', 'Items processed together in one batch', ('kind',), SIZE_BUCKETS)
+requests_total = registry.counter('http_requests_total', 'Requests handled', ('endpoint', 'method', 'status'))
+request_seconds = registry.histogram(
+    'http_request_duration_seconds', 'Request latency up to the last byte of the body', ('endpoint', 'method'))
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with serialization time recorded as a stage"""
+
+    def dumps(self, obj, **kwargs):
+        with stage_seconds.time(stage='json'):
+            return super().dumps(obj, **kwargs)
+
+
+class _ClosingBody:
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.on_close()
+
+
+def instrument(app):
+    """Count and time every request per route, and serve /metrics.
+
+    Latency runs until the response body has been fully sent, so streamed
+    responses are measured end to end.
+    """
+    @app.after_request
+    def remember_endpoint(response):
+        request.environ['metrics.endpoint'] = request.url_rule.rule if request.url_rule else 'unmatched'
+        return response
+
+    wsgi_app = app.wsgi_app
+
+    def timed_wsgi_app(environ, start_response):
+        started = time.perf_counter()
+        status = {}
+
+        def start(status_line, headers, exc_info=None):
+            status['code'] = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        def finished():
+            endpoint = environ.get('metrics.endpoint', 'unmatched')
+            method = environ.get('REQUEST_METHOD', '')
+            requests_total.inc(endpoint=endpoint, method=method, status=status.get('code', '500'))
+            request_seconds.observe(time.perf_counter() - started, endpoint=endpoint, method=method)
+
+        return _ClosingBody(wsgi_app(environ, start), finished)
+
+    app.wsgi_app = timed_wsgi_app
+    app.json = TimedJSONProvider(app)
+    app.add_url_rule('/metrics', 'metrics', lambda: Response(registry.render(), mimetype='text/plain; version=0.0.4'))
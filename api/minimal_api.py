@@ -1,122 +1,372 @@
 # minimal_api.py - FIXED VERSION
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+import numpy as np
+import os
 import re
+import hashlib
 import json
-from collections import Counter  # This was missing!
+import multiprocessing
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, deque, namedtuple  # This was missing!
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from metrics import batch_size, instrument, registry, stage_seconds
 
 app = Flask(__name__)
 CORS(app)
+instrument(app)
 
-# Enhanced toxic word database
 # ============================================
-# ENHANCED TOXIC PATTERNS DATABASE
+# COMPILED PATTERN MATCHER
 # ============================================
 
-TOXIC_PATTERNS = {
-    # SEVERE TOXIC - Highest priority
-    'severe_toxic': {
-        'words': [
-            'kill', 'die', 'suicide', 'murder', 'hurt you', 'go die', 'worthless', 'no one likes you', 'nobody loves you', 'should die', 'kill yourself', 'end your life', 'jump off', 'hang yourself', 'shoot yourself', 'better off dead', 'waste of life', 'waste of space', 'die slowly'
-        ],
-        'weight': 0.9,
-        'category': 'severe_toxic',
-        'color': '#d32f2f'
-    },
-    
-    # HARASSMENT & BULLYING
-    'harassment': {
-        'words': [
-            'stupid', 'idiot', 'dumb', 'moron', 'retard', 'imbecile', 'fool', 'ignorant', 'brainless', 'mindless', 'unintelligent', 'slow'
-        ],
-        'weight': 0.6,
-        'category': 'harassment',
-        'color': '#f44336'
-    },
-    
-    # BODY SHAMING
-    'body_shaming': {
-        'words': [
-            'fat', 'obese', 'skinny', 'anorexic', 'bulimic', 'ugly', 'hideous', 'disgusting', 'gross', 'repulsive', 'deformed', 'pig', 'cow', 'whale', 'flat chested', 'no boobs', 'no butt', 'man boobs', 'beer belly'
-        ],
-        'weight': 0.7,
-        'category': 'body_shaming',
-        'color': '#ff6b6b'
-    },
-    
-    # INSULTS & NAME CALLING
-    'insults': {
-        'words': [
-            'hate', 'suck', 'awful', 'terrible', 'bad', 'worst', 'pathetic', 'loser', 'failure', 'joke', 'clown', 'jerk', 'asshole', 'bastard', 'bitch', 'douche', 'jackass', 'dipstick', 'knucklehead'
-        ],
-        'weight': 0.5,
-        'category': 'insults',
-        'color': '#ff9800'
-    },
-    
-    # HATE SPEECH - Identity based
-    'hate_speech': {
-        'patterns': [
-            r'\bhate you\b', r'\bi hate\b', r'\byou suck\b', r'\byou\'re (stupid|dumb|ugly|fat|idiot)\b', r'\byou are (stupid|dumb|ugly|fat|idiot)\b', r'\bfuck you\b', r'\bstfu\b', r'\bshut up\b'
-        ],
-        'weight': 0.6,
-        'category': 'hate_speech',
-        'color': '#ff5722'
-    },
-    
-    # DISCRIMINATION - Race, Religion, Gender
-    'discrimination': {
-        'words': [
-            'black', 'white', 'asian', 'chinese', 'indian', 'muslim', 'christian', 'jewish', 'hindu', 'gay', 'lesbian', 'trans', 'homosexual', 'queer', 'immigrant', 'refugee', 'foreigner'
-        ],  # Add actual slurs - using neutral terms for safety
-        'weight': 0.8,
-        'category': 'discrimination',
-        'color': '#9c27b0'
-    },
-    
-    # SEXUAL HARASSMENT
-    'sexual_harassment': {
-        'words': [
-            'sexy', 'hot', 'slut', 'whore', 'babe', 'boobs', 'tits', 'ass', 'porn', 'nude', 'naked', 'strip', 'cam girl', 'onlyfans', 'send nudes', 'show boobs', 'show body'
-        ],
-        'weight': 0.7,
-        'category': 'sexual_harassment',
-        'color': '#e91e63'
-    },
-    
-    # THREATS & INTIMIDATION
-    'threats': {
-        'words': [
-            'beat', 'hit', 'punch', 'slap', 'fight', 'attack', 'hurt', 'harm', 'break your', 'smash your', 'destroy your', 'ruin your', 'find you', 'get you', 'come after', 'track you down'
-        ],
-        'weight': 0.8,
-        'category': 'threats',
-        'color': '#c2185b'
-    },
-    
-    # SPAM & MISLEADING
-    'spam': {
-        'words': [
-            'subscribe', 'follow me', 'like my', 'check my channel', 'click link', 'bit.ly', 'tinyurl', 'earn money', 'free gift', 'win prize', 'lottery', 'casino', 'bet now'
-        ],
-        'weight': 0.3,
-        'category': 'spam',
-        'color': '#757575'
-    },
-    
-    # PROFANITY - Mild swearing
-    'profanity': {
-        'words': [
-            'damn', 'hell', 'crap', 'piss', 'shit', 'fuck', 'screw','bloody', 'arse', 'bugger', 'bollocks'
-        ],
-        'weight': 0.4,
-        'category': 'profanity',
-        'color': '#ffb74d'
-    }
-}
+PatternMatch = namedtuple('PatternMatch', ['category', 'kind', 'phrase', 'start', 'end'])
+_WORD_CHAR = re.compile(r'\w')
+
+
+def _trie_regex(phrases):
+    """Regex for a set of literal phrases, factored into a character trie.
+
+    Each alternative starts with a plain literal, so the regex engine rejects
+    a position after one comparison per trie level instead of one per phrase.
+    Longer phrases are tried before their prefixes.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+def _starts_on_boundary(pattern):
+    """Whether every match of pattern starts after a non-word character:
+    it opens with \\b and a required word character and has no top-level |"""
+    if not (pattern.startswith(r'\b') and _WORD_CHAR.match(pattern, 2)) or pattern[3:4] in ('?', '*', '{'):
+        return False
+    depth, in_class, escaped = 0, False, False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char in '()':
+            depth += 1 if char == '(' else -1
+        elif char == '|' and depth == 0:
+            return False
+    return True
+
+
+# After "(?" these open a plain group or lookaround, which keeps its meaning
+# inside a larger regex
+_PLAIN_GROUP_OPENERS = (':', '=', '!', '<=', '<!', '>')
+
+
+def _is_self_contained(pattern):
+    """Whether pattern means the same inside a combined alternation: no
+    backreferences, named groups, conditionals or inline flags, which
+    either point at group numbers that shift or are only valid once"""
+    in_class, escaped = False, False
+    for i, char in enumerate(pattern):
+        if escaped:
+            escaped = False
+            if not in_class and char in '123456789':
+                return False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(' and pattern.startswith('?', i + 1) and not pattern.startswith(_PLAIN_GROUP_OPENERS, i + 2):
+            return False
+    return True
+
+
+class PatternMatcher:
+    """All lexicon words and regexes compiled into one automaton.
+
+    Words are matched on word boundaries. Every hit is reported with its
+    offsets, including hits that overlap or nest inside a longer phrase
+    ('kill' inside 'kill yourself'). Patterns that are not self-contained
+    (backreferences, named groups, inline flags) are scanned with their own
+    regex instead of joining the automaton.
+    """
+
+    def __init__(self, patterns):
+        self.entries = []
+        for category, data in patterns.items():
+            for word in data.get('words', []):
+                self.entries.append((category, 'word', word))
+            for pattern in data.get('patterns', []):
+                self.entries.append((category, 'pattern', pattern))
+
+        # The combined regex only finds candidate starts; each entry is then
+        # matched on its own. Words, and patterns that can only start on a
+        # word boundary, share one boundary check so the engine can skip
+        # mid-word offsets with a single test (it stands in for their leading
+        # \b). Candidates are confirmed by each entry's own regex run on the
+        # full text, so lookarounds and open endings mean what the moderator
+        # wrote.
+        bounded, unbounded, separate = [], [], []
+        for _, kind, phrase in self.entries:
+            if kind == 'word':
+                continue
+            if not _is_self_contained(phrase):
+                separate.append(re.compile(phrase))
+            elif _starts_on_boundary(phrase):
+                bounded.append(phrase[2:])
+            else:
+                unbounded.append(f'(?:{phrase})')
+        words = [phrase for _, kind, phrase in self.entries if kind == 'word']
+        if words:
+            bounded.insert(0, _trie_regex(words) + r'(?!\w)')
+        if bounded:
+            unbounded.insert(0, r'(?<!\w)(?:' + '|'.join(bounded) + ')')
+        self.regex = re.compile('|'.join(unbounded) or r'(?!)')
+        # Regexes that find candidate starts: the automaton, then each
+        # pattern that could not join it
+        self._scanners = ([self.regex] if unbounded else []) + separate
+
+        self._words = {}
+        self._patterns = []
+        for i, (_, kind, phrase) in enumerate(self.entries):
+            if kind == 'word':
+                self._words.setdefault(phrase, []).append(i)
+            else:
+                self._patterns.append((i, re.compile(phrase)))
+        self._word_lengths = sorted({len(word) for word in self._words}, reverse=True)
+
+    def _entries_at(self, text, start):
+        """(entry index, end) of every entry matching text at offset start"""
+        found = []
+        if self._words and not (start and _WORD_CHAR.match(text, start - 1)):
+            for length in self._word_lengths:
+                end = start + length
+                if end <= len(text) and text[start:end] in self._words and not _WORD_CHAR.match(text, end):
+                    found.extend((i, end) for i in self._words[text[start:end]])
+        for i, single in self._patterns:
+            sub = single.match(text, start)
+            if sub:
+                found.append((i, sub.end()))
+        return sorted(found)
+
+    @staticmethod
+    def _starts(regex, text):
+        starts = []
+        m = regex.search(text)
+        while m:
+            starts.append(m.start())
+            m = regex.search(text, m.start() + 1)
+        return starts
+
+    def find_all(self, text):
+        """Return every PatternMatch in text, ordered by start offset"""
+        if len(self._scanners) == 1:
+            starts = self._starts(self._scanners[0], text)
+        else:
+            starts = sorted(set().union(*(self._starts(regex, text) for regex in self._scanners)))
+        
+        matches = []
+        for start in starts:
+            for i, end in self._entries_at(text, start):
+                category, kind, phrase = self.entries[i]
+                matches.append(PatternMatch(category, kind, phrase, start, end))
+        return matches
+
+
+# ============================================
+# LEXICON (hot-reloaded from lexicon.json)
+# ============================================
+
+# One lexicon file for every engine: the repo-root lexicon.json, which both
+# this module and its copy under api/ (flask_api's cascade) find by default.
+# Deployments that keep it elsewhere point LEXICON_PATH at it.
+def _default_lexicon_path():
+    here = os.path.dirname(os.path.abspath(__file__))
+    for directory in (here, os.path.dirname(here)):
+        path = os.path.join(directory, 'lexicon.json')
+        if os.path.exists(path):
+            return path
+    return os.path.join(here, 'lexicon.json')
+
+
+LEXICON_PATH = os.environ.get('LEXICON_PATH') or _default_lexicon_path()
+LEXICON_RELOAD_INTERVAL = float(os.environ.get('LEXICON_RELOAD_INTERVAL', '5'))
+
+Lexicon = namedtuple('Lexicon', ['version', 'patterns', 'matcher', 'mtime', 'digest'])
+
+
+def load_lexicon(path=LEXICON_PATH):
+    """Read a lexicon file and compile its matcher"""
+    mtime = os.stat(path).st_mtime_ns
+    with open(path, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw.decode('utf-8'))
+    
+    patterns = data['patterns']
+    for category, entry in patterns.items():
+        if 'weight' not in entry or not ('words' in entry or 'patterns' in entry):
+            raise ValueError(f"Lexicon category '{category}' needs a weight and words or patterns")
+        for pattern in entry.get('patterns', []):
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"Lexicon category '{category}' has an invalid pattern {pattern!r}: {e}")
+        entry.setdefault('category', category)
+    
+    # The content digest names the lexicon in cache keys: unlike the version
+    # it changes on every edit, and unlike the mtime it is the same on every
+    # host serving the file
+    digest = hashlib.sha256(raw).hexdigest()[:16]
+    return Lexicon(data['version'], patterns, PatternMatcher(patterns), mtime, digest)
+
+
+_lexicon = load_lexicon()
+_lexicon_checked = time.monotonic()
+_lexicon_lock = threading.Lock()
+
+
+def current_lexicon():
+    """Active lexicon, recompiled and swapped in when the file changes.
+
+    At most one request per worker checks the file every
+    LEXICON_RELOAD_INTERVAL seconds; everyone else keeps using the current
+    lexicon, and a broken file leaves it in place.
+    """
+    global _lexicon, _lexicon_checked
+    
+    if time.monotonic() - _lexicon_checked < LEXICON_RELOAD_INTERVAL:
+        return _lexicon
+    if not _lexicon_lock.acquire(blocking=False):
+        return _lexicon
+    
+    try:
+        _lexicon_checked = time.monotonic()
+        if os.stat(LEXICON_PATH).st_mtime_ns != _lexicon.mtime:
+            _lexicon = load_lexicon()
+            print(f"✅ Lexicon v{_lexicon.version} loaded")
+    except Exception as e:
+        print(f"Error reloading lexicon: {str(e)}")
+    finally:
+        _lexicon_lock.release()
+    
+    return _lexicon
+
+
+# ============================================
+# TEXT FEATURES (non-lexicon heuristics)
+# ============================================
+
+PERSONAL_ATTACK_RE = re.compile(r'\byou\'?re?\b')
+PERSONAL_ATTACK_WORDS = ('stupid', 'idiot', 'ugly', 'fat')
+_ASCII_UPPER = bytes(range(ord('A'), ord('Z') + 1))
+
+TextFeatures = namedtuple('TextFeatures', [
+    'text_length', 'word_count', 'caps_ratio', 'punctuation_count', 'repeated_words', 'personal_attack', 'extra'
+])
+
+# Extra features: name -> fn(text, text_lower, tokens). They receive the
+# views already built for the core features, so a new signal (elongated
+# letters, emoji spam, ...) never re-lowers or re-splits the text; it does
+# read the text or tokens once more itself.
+FEATURE_EXTRACTORS = {}
+
+
+def text_feature(name):
+    def register(extractor):
+        FEATURE_EXTRACTORS[name] = extractor
+        return extractor
+    return register
+
+
+def extract_features(text, text_lower, caps_ratio=None, punctuation_count=None, detected_words=()):
+    """Every non-lexicon signal of a text.
+    
+    This is several passes, each a C-level call: one split, then for ASCII
+    text an encode, a translate and two counts over the bytes (only
+    non-ASCII text falls back to str.isupper per character), the attack
+    word scans, and a Counter of the tokens when detected_words is not
+    empty. Registered extractors add a pass each. detect_batch() passes
+    caps_ratio and punctuation_count precomputed for the whole batch.
+    
+    repeated_words is how many of detected_words occur more than once as
+    a token; the tokens themselves are not kept.
+    """
+    tokens = text_lower.split()
+    if caps_ratio is None or punctuation_count is None:
+        if text.isascii():
+            data = text.encode('ascii')
+            caps = len(data) - len(data.translate(None, _ASCII_UPPER))
+            punctuation = data.count(b'!') + data.count(b'?') * 0.5
+        else:
+            caps = sum(map(str.isupper, text))
+            punctuation = text.count('!') + text.count('?') * 0.5
+        if caps_ratio is None:
+            caps_ratio = caps / max(len(text), 1)
+        if punctuation_count is None:
+            punctuation_count = punctuation
+    
+    # Clean text skips the count
+    repeated_words = 0
+    if detected_words:
+        token_counts = Counter(tokens)
+        repeated_words = sum(1 for word in set(detected_words) if token_counts.get(word, 0) > 1)
+    
+    # The cheap substring test gates the regex
+    personal_attack = (any(word in text_lower for word in PERSONAL_ATTACK_WORDS)
+                       and PERSONAL_ATTACK_RE.search(text_lower) is not None)
+    
+    extra = {name: extractor(text, text_lower, tokens) for name, extractor in FEATURE_EXTRACTORS.items()}
+    return TextFeatures(len(text), len(tokens), caps_ratio, punctuation_count, repeated_words, personal_attack, extra)
+
+
+# Heuristic signals: fn(features) -> (score, category) or None, applied in
+# order after the lexicon scores. A new signal registers its feature above
+# and its rule here.
+def _yelling(features):
+    if features.caps_ratio > 0.7 and features.text_length > 10:
+        return 0.3, 'yelling'
+
+
+def _excessive_punctuation(features):
+    if features.punctuation_count > 5:
+        return min(features.punctuation_count * 0.1, 0.3), 'excessive_punctuation'
+
+
+def _personal_attack(features):
+    # Targeted at "you"
+    if features.personal_attack:
+        return 0.4, 'personal_attack'
+
+
+HEURISTICS = [_yelling, _excessive_punctuation, _personal_attack]
 
-def detect_cyberbullying(text):
-    """Advanced rule-based detection with severity levels"""
+
+def detect_cyberbullying(text, lexicon=None, caps_ratio=None, punctuation_count=None):
+    """Advanced rule-based detection with severity levels
+    
+    detect_batch() passes a shared lexicon snapshot and precomputed caps
+    ratio and punctuation count; single calls compute them in
+    extract_features().
+    """
+    lexicon = lexicon or current_lexicon()
     text_lower = text.lower().strip()
     
     if len(text_lower) < 3:
@@ -125,6 +375,7 @@ def detect_cyberbullying(text):
             'categories': [], 
             'isToxic': False,
             'severity': 'none',
+            'warning': '',
             'confidence': 0
         }
     
@@ -133,51 +384,38 @@ def detect_cyberbullying(text):
     detected_words = []
     category_scores = {}
     
-    # Check each category
-    for category, data in TOXIC_PATTERNS.items():
+    # Find every word and pattern hit in one pass
+    matches = lexicon.matcher.find_all(text_lower)
+    hits = {}
+    for match in matches:
+        hits.setdefault(match.category, {})[match.phrase] = match.kind
+    
+    # Score each category
+    for category, data in lexicon.patterns.items():
         category_score = 0
         
-        # Check words
-        if 'words' in data:
-            for word in data['words']:
-                if word in text_lower:
-                    category_score += data['weight']
-                    detected_words.append(word)
-                    categories.append(data['category'])
-        
-        # Check regex patterns
-        if 'patterns' in data:
-            for pattern in data['patterns']:
-                if re.search(pattern, text_lower):
-                    category_score += data['weight']
-                    categories.append(data['category'])
+        for phrase, kind in hits.get(category, {}).items():
+            category_score += data['weight']
+            categories.append(data['category'])
+            if kind == 'word':
+                detected_words.append(phrase)
         
         if category_score > 0:
             category_scores[category] = min(category_score, 1.0)
             total_score += category_score
     
-    # Check for repeated toxic words (more severe)
-    word_count = Counter(text_lower.split())
-    for word in set(detected_words):
-        if word_count.get(word, 0) > 1:
-            total_score += 0.2
-    
-    # Check for all caps (yelling)
-    caps_ratio = sum(1 for c in text if c.isupper()) / max(len(text), 1)
-    if caps_ratio > 0.7 and len(text) > 10:
-        total_score += 0.3
-        categories.append('yelling')
-    
-    # Check for excessive punctuation
-    punctuation_count = text.count('!') + text.count('?') * 0.5
-    if punctuation_count > 5:
-        total_score += min(punctuation_count * 0.1, 0.3)
-        categories.append('excessive_punctuation')
-    
-    # Check for personal attacks (targeted at "you")
-    if re.search(r'\byou\'?re?\b', text_lower) and any(word in text_lower for word in ['stupid', 'idiot', 'ugly', 'fat']):
-        total_score += 0.4
-        categories.append('personal_attack')
+    features = extract_features(text, text_lower, caps_ratio, punctuation_count, detected_words)
+    
+    # Repeated toxic words are more severe
+    for _ in range(features.repeated_words):
+        total_score += 0.2
+    
+    # Yelling, excessive punctuation, personal attacks, ...
+    for heuristic in HEURISTICS:
+        signal = heuristic(features)
+        if signal:
+            total_score += signal[0]
+            categories.append(signal[1])
     
     # Normalize score (0-1)
     final_score = min(total_score, 1.0)
@@ -197,8 +435,8 @@ def detect_cyberbullying(text):
     # Determine if toxic
     is_toxic = final_score > 0.4  # Lowered threshold for better sensitivity
     
-    # Get unique categories
-    unique_categories = list(set(categories))
+    # Get unique categories, in a fixed order so every worker process agrees
+    unique_categories = list(dict.fromkeys(categories))
     
     # Generate enhanced warning message
     warning = ""
@@ -218,7 +456,7 @@ def detect_cyberbullying(text):
         top_categories.append({
             'name': cat,
             'score': score,
-            'color': TOXIC_PATTERNS.get(cat, {}).get('color', '#ff9800')
+            'color': lexicon.patterns.get(cat, {}).get('color', '#ff9800')
         })
     
     return {
@@ -227,22 +465,360 @@ def detect_cyberbullying(text):
         'isToxic': is_toxic,
         'severity': severity,
         'warning': warning,
-        'toxicWords': list(set(detected_words)),
-        'textLength': len(text),
-        'wordCount': len(text.split()),
+        'toxicWords': list(dict.fromkeys(detected_words)),
+        'textLength': features.text_length,
+        'wordCount': features.word_count,
         'categoryDetails': top_categories,
-        'capsRatio': round(caps_ratio, 2),
-        'punctuationCount': punctuation_count
+        'capsRatio': round(features.caps_ratio, 2),
+        'punctuationCount': features.punctuation_count,
+        'matches': [
+            {'phrase': m.phrase, 'category': m.category, 'start': m.start, 'end': m.end}
+            for m in matches
+        ]
     }
 
+# ============================================
+# BATCH ENGINE
+# ============================================
+
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '10000'))
+BATCH_CHUNK_SIZE = int(os.environ.get('BATCH_CHUNK_SIZE', '500'))
+
+
+def batch_features(texts):
+    """Caps ratio and punctuation count of every text, computed together.
+    
+    All texts are concatenated into one array of code points and the
+    per-text counts are read off cumulative sums at the text boundaries.
+    """
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    
+    upper = (codes >= 65) & (codes <= 90)
+    non_ascii = np.flatnonzero(codes > 127)
+    if non_ascii.size:
+        upper[non_ascii] = [chr(c).isupper() for c in codes[non_ascii].tolist()]
+    
+    def per_text(mask):
+        totals = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+        return totals[ends] - totals[starts]
+    
+    caps_ratios = per_text(upper) / np.maximum(lengths, 1)
+    punctuation_counts = per_text(codes == 33) + per_text(codes == 63) * 0.5
+    return caps_ratios.tolist(), punctuation_counts.tolist()
+
+
+def detect_batch(texts, lexicon=None):
+    """detect_cyberbullying for a list of texts sharing one lexicon snapshot"""
+    lexicon = lexicon or current_lexicon()
+    with stage_seconds.time(stage='features'):
+        caps_ratios, punctuation_counts = batch_features(texts)
+    with stage_seconds.time(stage='rules_batch'):
+        return [
+            detect_cyberbullying(text, lexicon, caps_ratio, punctuation_count)
+            for text, caps_ratio, punctuation_count in zip(texts, caps_ratios, punctuation_counts)
+        ]
+
+# ============================================
+# PROCESS POOL (large batches on every core)
+# ============================================
+
+# Batches of at least BATCH_PARALLEL_THRESHOLD texts, and NDJSON streams once
+# they have delivered that many, are spread over BATCH_PROCESSES worker
+# processes; 0 or 1 keeps everything in the request thread. Every web worker
+# starts its own pool, so the default splits the cores between the
+# WEB_CONCURRENCY workers the Procfile runs
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '2'))
+BATCH_PROCESSES = int(os.environ.get('BATCH_PROCESSES', str(max(1, (os.cpu_count() or 1) // max(WEB_CONCURRENCY, 1)))))
+BATCH_PARALLEL_THRESHOLD = int(os.environ.get('BATCH_PARALLEL_THRESHOLD', '2000'))
+
+_batch_pool = None
+_batch_pool_pid = None
+_batch_pool_lock = threading.Lock()
+
+
+def batch_pool():
+    """The process pool, started on first use (once per web worker)"""
+    global _batch_pool, _batch_pool_pid
+    
+    if BATCH_PROCESSES <= 1:
+        return None
+    with _batch_pool_lock:
+        if _batch_pool is None or _batch_pool_pid != os.getpid():
+            # Spawned workers import this module, which compiles the lexicon
+            # once per worker; fork is avoided as the server is threaded
+            _batch_pool = ProcessPoolExecutor(BATCH_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+            _batch_pool_pid = os.getpid()
+        return _batch_pool
+
+
+def _detect_chunk(texts, lexicon_mtime):
+    """detect_batch in a pool worker on the parent's lexicon, or None when
+    the file on disk is no longer that lexicon"""
+    global _lexicon
+    
+    if _lexicon.mtime != lexicon_mtime:
+        try:
+            if os.stat(LEXICON_PATH).st_mtime_ns == lexicon_mtime:
+                _lexicon = load_lexicon()
+        except Exception as e:
+            print(f"Error reloading lexicon in pool worker: {str(e)}")
+        if _lexicon.mtime != lexicon_mtime:
+            return None
+    return detect_batch(texts, _lexicon)
+
+
+def detect_chunks(chunks, key=None, total=None):
+    """Yield (chunk, detect_batch(key(chunk))) for each chunk, in input order.
+    
+    The pool is used for a batch of total >= BATCH_PARALLEL_THRESHOLD
+    texts, and for a stream of unknown size once it has delivered that
+    many; up to two chunks per worker are then in flight at a time. Chunks
+    are consumed lazily either way.
+    """
+    global _batch_pool
+    
+    key = key or (lambda chunk: chunk)
+    chunks = iter(chunks)
+    if BATCH_PROCESSES <= 1 or (total is not None and total < BATCH_PARALLEL_THRESHOLD):
+        for chunk in chunks:
+            yield chunk, detect_batch(key(chunk))
+        return
+    
+    if total is None:
+        # Most uploads are small: no processes are started for them
+        seen = 0
+        for chunk in chunks:
+            texts = key(chunk)
+            yield chunk, detect_batch(texts)
+            seen += len(texts)
+            if seen >= BATCH_PARALLEL_THRESHOLD:
+                break
+        else:
+            return
+    
+    pool = batch_pool()
+    lexicon = current_lexicon()
+    in_flight = deque()
+    
+    def result(texts, future):
+        # Stage timings recorded inside workers stay there; this is the
+        # chunk's time as seen from here, queueing included
+        with stage_seconds.time(stage='rules_pool'):
+            detections = future.result()
+        if detections is None:
+            # The lexicon file changed under us; score with our snapshot
+            detections = detect_batch(texts, lexicon)
+        return detections
+    
+    try:
+        for chunk in chunks:
+            texts = key(chunk)
+            in_flight.append((chunk, texts, pool.submit(_detect_chunk, texts, lexicon.mtime)))
+            if len(in_flight) >= BATCH_PROCESSES * 2:
+                chunk, texts, future = in_flight.popleft()
+                yield chunk, result(texts, future)
+        while in_flight:
+            chunk, texts, future = in_flight.popleft()
+            yield chunk, result(texts, future)
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool for the next request
+        with _batch_pool_lock:
+            _batch_pool = None
+        raise
+    finally:
+        for _, _, future in in_flight:
+            future.cancel()
+
+# ============================================
+# RESULT CACHE
+# ============================================
+
+DETECTION_CACHE_BACKEND = os.environ.get('DETECTION_CACHE_BACKEND', 'memory')  # memory | sqlite | none
+DETECTION_CACHE_SIZE = int(os.environ.get('DETECTION_CACHE_SIZE', '10000'))
+DETECTION_CACHE_TTL = float(os.environ.get('DETECTION_CACHE_TTL', '3600'))
+DETECTION_CACHE_PATH = os.environ.get('DETECTION_CACHE_PATH', '/tmp/detection_cache.sqlite3')
+
+
+class DetectionCache:
+    """Thread-safe LRU cache of detection results with a TTL"""
+    
+    backend = 'memory'
+    
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _get_local(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+    
+    def _put_local(self, key, value, expires):
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def _get_shared(self, key):
+        return None
+    
+    def _put_shared(self, key, value, expires):
+        pass
+    
+    def get(self, key):
+        with self._lock:
+            value = self._get_local(key)
+        if value is None:
+            shared = self._get_shared(key)
+            if shared is not None:
+                value, expires = shared
+                with self._lock:
+                    self._put_local(key, value, expires)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+    
+    def put(self, key, value):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._put_local(key, value, expires)
+        self._put_shared(key, value, expires)
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.backend,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 3) if lookups else 0
+            }
+
+
+class SharedDetectionCache(DetectionCache):
+    """DetectionCache backed by a SQLite file shared by every worker on a host.
+    
+    The in-process LRU stays in front; results missing there are looked up
+    in the file before being recomputed. SQLite errors (e.g. a busy lock)
+    count as a miss rather than failing the request.
+    """
+    
+    backend = 'sqlite'
+    
+    def __init__(self, maxsize, ttl, path):
+        super().__init__(maxsize, ttl)
+        self.path = path
+        self._local = threading.local()
+        self._puts = 0
+    
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=0.5, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=OFF')
+            db.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, expires REAL)')
+            self._local.db = db
+        return db
+    
+    def _get_shared(self, key):
+        try:
+            row = self._db().execute(
+                'SELECT value, expires FROM results WHERE key = ? AND expires > ?', (key, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return (json.loads(row[0]), row[1]) if row else None
+    
+    def _put_shared(self, key, value, expires):
+        try:
+            db = self._db()
+            db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', (key, json.dumps(value), expires))
+            self._puts += 1
+            if self._puts % 1000 == 0:
+                db.execute('DELETE FROM results WHERE expires < ?', (time.time(),))
+                db.execute(
+                    'DELETE FROM results WHERE key IN '
+                    '(SELECT key FROM results ORDER BY expires DESC LIMIT -1 OFFSET ?)', (self.maxsize,)
+                )
+        except sqlite3.Error:
+            pass
+
+
+def make_detection_cache():
+    if DETECTION_CACHE_BACKEND == 'none':
+        return None
+    if DETECTION_CACHE_BACKEND == 'sqlite':
+        return SharedDetectionCache(DETECTION_CACHE_SIZE, DETECTION_CACHE_TTL, DETECTION_CACHE_PATH)
+    return DetectionCache(DETECTION_CACHE_SIZE, DETECTION_CACHE_TTL)
+
+
+detection_cache = make_detection_cache()
+
+
+def cached_detect(text):
+    """detect_cyberbullying through the result cache.
+    
+    Keys are the text plus the digest of the lexicon file, so any edit
+    to lexicon.json invalidates every cached result. The text is not
+    folded at all because case, whitespace and length feed the result.
+    """
+    lexicon = current_lexicon()
+    if detection_cache is None:
+        with stage_seconds.time(stage='rules'):
+            return detect_cyberbullying(text, lexicon)
+    
+    key = f'{lexicon.digest}:{text}'
+    result = detection_cache.get(key)
+    if result is None:
+        with stage_seconds.time(stage='rules'):
+            result = detect_cyberbullying(text, lexicon)
+        detection_cache.put(key, result)
+    return result
+
+
+def _cache_lookups():
+    if detection_cache is None:
+        return None
+    stats = detection_cache.stats()
+    return {('hit',): stats['hits'], ('miss',): stats['misses']}
+
+
+registry.callback('detection_cache_lookups_total', 'Result cache lookups', _cache_lookups,
+                  labels=('result',), kind='counter')
+registry.callback('detection_cache_entries', 'Results held in this worker\'s cache',
+                  lambda: detection_cache.stats()['size'] if detection_cache else None)
+registry.callback('lexicon_version', 'Version of the active lexicon', lambda: _lexicon.version)
+
 @app.route('/api/health', methods=['GET'])
 def health():
+    lexicon = current_lexicon()
     return jsonify({
         'status': 'healthy',
         'model': 'Advanced Rule-Based Detector v2',
-        'endpoints': ['/api/detect', '/api/batch-detect', '/api/health'],
+        'endpoints': ['/api/detect', '/api/batch-detect', '/api/stream-detect', '/api/health', '/metrics'],
         'version': '1.0.0',
-        'patterns_loaded': len(TOXIC_PATTERNS)
+        'patterns_loaded': len(lexicon.patterns),
+        'lexicon_version': lexicon.version,
+        'cache': detection_cache.stats() if detection_cache else None,
+        'batchProcesses': BATCH_PROCESSES if BATCH_PROCESSES > 1 else 0
     })
 
 @app.route('/api/detect', methods=['POST'])
@@ -262,7 +838,7 @@ def detect():
                 'severity': 'none'
             }), 200
         
-        result = detect_cyberbullying(text)
+        result = cached_detect(text)
         
         return jsonify({
             'success': True,
@@ -278,7 +854,8 @@ def detect():
                 'wordCount': result['wordCount'],
                 'capsRatio': result['capsRatio'],
                 'punctuationCount': result['punctuationCount'],
-                'categoryDetails': result['categoryDetails']
+                'categoryDetails': result['categoryDetails'],
+                'matches': result['matches']
             }
         })
         
@@ -300,32 +877,108 @@ def batch_detect():
         if not texts or not isinstance(texts, list):
             return jsonify({'error': 'No texts array provided'}), 400
         
-        results = []
-        for text in texts:
-            result = detect_cyberbullying(text)
-            results.append({
-                'text': text[:50] + ('...' if len(text) > 50 else ''),
-                'isCyberbullying': result['isToxic'],
-                'score': result['score'],
-                'categories': result['categories'],
-                'warning': result['warning']
-            })
+        if len(texts) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Too many texts (max {MAX_BATCH_SIZE})'}), 413
         
-        return jsonify({
-            'success': True,
-            'count': len(results),
-            'results': results
-        })
+        if not all(isinstance(text, str) for text in texts):
+            return jsonify({'error': 'All texts must be strings'}), 400
+        
+        batch_size.observe(len(texts), kind='rules')
+        
+        # Results are detected and serialized BATCH_CHUNK_SIZE at a time
+        def generate():
+            yield '{"success": true, "count": %d, "results": [' % len(texts)
+            chunks = (texts[offset:offset + BATCH_CHUNK_SIZE] for offset in range(0, len(texts), BATCH_CHUNK_SIZE))
+            for index, (chunk, detections) in enumerate(detect_chunks(chunks, total=len(texts))):
+                results = []
+                for text, result in zip(chunk, detections):
+                    results.append({
+                        'text': text[:50] + ('...' if len(text) > 50 else ''),
+                        'isCyberbullying': result['isToxic'],
+                        'score': result['score'],
+                        'categories': result['categories'],
+                        'warning': result['warning']
+                    })
+                with stage_seconds.time(stage='json'):
+                    serialized = json.dumps(results)[1:-1]
+                yield (', ' if index else '') + serialized
+            yield ']}'
+        
+        return Response(generate(), mimetype='application/json')
         
     except Exception as e:
         print(f"Error in /api/batch-detect: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stream-detect', methods=['POST'])
+def stream_detect():
+    """Detect over a newline-delimited JSON upload, answering in NDJSON.
+    
+    Each input line is a JSON string or an object holding the text under
+    ?field= (default 'text'); ?id_field= echoes an identifier back. Lines
+    are read and answered BATCH_CHUNK_SIZE at a time, so memory stays flat
+    however large the upload is.
+    """
+    field = request.args.get('field', 'text')
+    id_field = request.args.get('id_field')
+    
+    def parse(line_number, line):
+        item = json.loads(line)
+        text = item if isinstance(item, str) else item.get(field) if isinstance(item, dict) else None
+        if not isinstance(text, str):
+            raise ValueError(f"No '{field}' string on line")
+        result = {'line': line_number}
+        if id_field and isinstance(item, dict):
+            result['id'] = item.get(id_field)
+        return result, text
+    
+    def texts_of(pending):
+        return [text for _, text in pending if text is not None]
+    
+    def answer(pending, detections):
+        detections = iter(detections)
+        for result, text in pending:
+            if text is not None:
+                detection = next(detections)
+                result.update({
+                    'isCyberbullying': detection['isToxic'],
+                    'score': detection['score'],
+                    'severity': detection['severity'],
+                    'categories': detection['categories'],
+                    'warning': detection['warning']
+                })
+        with stage_seconds.time(stage='json'):
+            return ''.join(json.dumps(result) + '\n' for result, _ in pending)
+    
+    def chunks():
+        pending = []
+        for line_number, line in enumerate(request.stream, 1):
+            if not line.strip():
+                continue
+            try:
+                pending.append(parse(line_number, line))
+            except Exception as e:
+                pending.append(({'line': line_number, 'error': str(e)}, None))
+            
+            if len(pending) >= BATCH_CHUNK_SIZE:
+                yield pending
+                pending = []
+        
+        if pending:
+            yield pending
+    
+    def generate():
+        for pending, detections in detect_chunks(chunks(), key=texts_of):
+            batch_size.observe(len(pending), kind='stream')
+            yield answer(pending, detections)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({
         'message': 'Cyberbullying Detection API is running',
-        'endpoints': ['/api/health', '/api/detect', '/api/batch-detect'],
+        'endpoints': ['/api/health', '/api/detect', '/api/batch-detect', '/api/stream-detect', '/metrics'],
         'documentation': 'POST text to /api/detect for detection'
     })
 
@@ -337,7 +990,7 @@ if __name__ == '__main__':
     ║  Running on http://localhost:5000        ║
     ╚══════════════════════════════════════════╝
     """)
-    print(f"✅ Loaded {len(TOXIC_PATTERNS)} detection patterns")
+    print(f"✅ Loaded {len(_lexicon.patterns)} detection patterns (lexicon v{_lexicon.version})")
     print("✅ CORS enabled")
     print("✅ Ready for requests")
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
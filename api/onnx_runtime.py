@@ -0,0 +1,158 @@
+# onnx_runtime.py - ONNX Runtime CPU sessions for the text and image models
+#   python onnx_runtime.py [text] [image]
+# run where the weights are, writes text_model.onnx and image_model.onnx and
+# checks them against the PyTorch outputs. INFERENCE_BACKEND=onnx then
+# serves /api/detect/text and /api/detect/image from them.
+import os
+import sys
+import threading
+import torch
+
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+ONNX_OPSET = int(os.environ.get("ONNX_OPSET", "17"))
+# Largest class-probability difference an export may have from PyTorch
+ONNX_PARITY_TOLERANCE = float(os.environ.get("ONNX_PARITY_TOLERANCE", "1e-4"))
+
+
+def onnx_file(pth_path):
+    return os.path.splitext(pth_path)[0] + ".onnx"
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class OnnxModel:
+    """An ONNX Runtime session called like the PyTorch model it was exported
+    from: tensors in, logits tensor out.
+
+    Sessions run with all graph optimizations and as many intra-op threads
+    as torch is set to use. ORT's thread pool does not survive fork, so a
+    forked worker opens its own session on first use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self.metadata = dict(self.session().get_modelmeta().custom_metadata_map)
+
+    def session(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    import onnxruntime as ort
+                    options = ort.SessionOptions()
+                    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    options.intra_op_num_threads = torch.get_num_threads()
+                    self._session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+                    self._input_names = [node.name for node in self._session.get_inputs()]
+                    self._pid = os.getpid()
+        return self._session
+
+    def __call__(self, *tensors):
+        session = self.session()
+        feeds = {name: tensor.detach().cpu().numpy() for name, tensor in zip(self._input_names, tensors)}
+        return torch.from_numpy(session.run(None, feeds)[0])
+
+
+def load_onnx_model(pth_path, weights_path):
+    """OnnxModel of pth_path's export, or None if there is none or it was
+    exported from other weights than weights_path"""
+    path = onnx_file(pth_path)
+    if not os.path.exists(path):
+        print(f"⚠️ {path} not found (run onnx_runtime.py), using PyTorch")
+        return None
+    model = OnnxModel(path)
+    if model.metadata.get("source_fingerprint") != _fingerprint(weights_path):
+        print(f"⚠️ {path} was exported from other weights than {weights_path}, using PyTorch")
+        return None
+    return model
+
+
+def parity(torch_model, onnx_model, batches):
+    """Largest class-probability difference and share of equal predictions
+    between the two models over input batches"""
+    worst, agree, total = 0.0, 0, 0
+    for inputs in batches:
+        with torch.no_grad():
+            expected = torch.softmax(torch_model(*inputs), dim=1)
+        actual = torch.softmax(onnx_model(*inputs), dim=1)
+        worst = max(worst, (expected - actual).abs().max().item())
+        agree += (expected.argmax(dim=1) == actual.argmax(dim=1)).sum().item()
+        total += len(expected)
+    return worst, agree / total
+
+
+def export(model, input_names, dynamic_axes, batches, pth_path, weights_path):
+    """Export model to ONNX next to pth_path and keep it only if it matches
+    PyTorch within ONNX_PARITY_TOLERANCE on every batch. The first batch
+    is the tracing example."""
+    import onnx
+    path = onnx_file(pth_path)
+    torch.onnx.export(model, batches[0], path, input_names=input_names, output_names=["logits"],
+                      dynamic_axes={**dynamic_axes, "logits": {0: "batch"}}, opset_version=ONNX_OPSET,
+                      dynamo=False)
+
+    worst, agreement = parity(model, OnnxModel(path), batches)
+    if worst > ONNX_PARITY_TOLERANCE:
+        os.remove(path)
+        raise ValueError(f"{path} differs from PyTorch by up to {worst:.2e} "
+                         f"(tolerance {ONNX_PARITY_TOLERANCE:.0e}), not written")
+
+    graph = onnx.load(path)
+    for key, value in {
+        "source": os.path.basename(weights_path),
+        "source_fingerprint": _fingerprint(weights_path),
+        "parity_max_diff": f"{worst:.2e}",
+        "parity_agreement": f"{agreement:.4f}"
+    }.items():
+        entry = graph.metadata_props.add()
+        entry.key, entry.value = key, value
+    onnx.save(graph, path)
+    print(f"✅ {weights_path} -> {path} (max probability diff {worst:.2e}, "
+          f"{agreement:.1%} same predictions over {sum(len(batch[0]) for batch in batches)} inputs)")
+    return path
+
+
+def export_text(api):
+    texts = [example["text"] for example in api.load_holdout(api.QUANTIZE_HOLDOUT) if "text" in example]
+    texts = texts or ["you are so stupid", "have a nice day", "nobody likes you, just leave"]
+    tokenizer = api.tokenizer_handle.get()
+
+    def encode(chunk):
+        encoding = tokenizer(chunk, padding=True, truncation=True, max_length=api.TEXT_MAX_LENGTH,
+                             return_tensors="pt")
+        return encoding["input_ids"], encoding["attention_mask"]
+
+    # Padded and unpadded rows, one token up to TEXT_MAX_LENGTH
+    batches = [encode(texts[:2]), encode(texts[:1]), encode(["hi"]), encode([" ".join(texts)] * 2)]
+    batches += [encode(texts[start:start + 16]) for start in range(0, len(texts), 16)]
+    axes = {0: "batch", 1: "sequence"}
+    return export(api.build_text_model(), ["input_ids", "attention_mask"],
+                  {"input_ids": axes, "attention_mask": axes}, batches,
+                  "text_model.pth", api.weights_file("text_model.pth"))
+
+
+def export_image(api):
+    generator = torch.Generator().manual_seed(0)
+    size = api.IMAGE_SIZE
+    batches = [(torch.randn(2, 3, size, size, generator=generator),),
+               (torch.randn(1, 3, size, size, generator=generator),),
+               (torch.randn(8, 3, size, size, generator=generator),)]
+    return export(api.build_image_model(), ["images"], {"images": {0: "batch"}}, batches,
+                  "image_model.pth", api.weights_file("image_model.pth"))
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or ["text", "image"]
+    if not set(names) <= {"text", "image"}:
+        sys.exit("usage: python onnx_runtime.py [text] [image]")
+    # Import the API without loading its models; the float PyTorch models
+    # are built here directly
+    os.environ["MODEL_LOADING"] = "lazy"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import flask_api
+    for name in names:
+        {"text": export_text, "image": export_image}[name](flask_api)
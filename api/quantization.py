@@ -0,0 +1,115 @@
+# quantization.py - Optional int8 dynamic quantization for CPU inference
+import json
+import os
+import torch
+import torch.nn as nn
+from torch.ao.nn.quantized import dynamic as quantized_dynamic
+
+QUANTIZE = os.environ.get("QUANTIZE", "0") == "1"
+# Held-out examples the int8 model may get wrong beyond those the float
+# model already gets wrong. A count rather than an accuracy drop, so that
+# one flipped prediction on a small holdout does not read as a percentage
+QUANTIZE_MAX_EXTRA_ERRORS = int(os.environ.get("QUANTIZE_MAX_EXTRA_ERRORS", "1"))
+
+def load_holdout(path):
+    """Labelled examples ({"text"|"image", "label"}) used to vet quantized models"""
+    if not os.path.exists(path):
+        return []
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                example = json.loads(line)
+                if "image" in example:
+                    example["image"] = os.path.join(os.path.dirname(os.path.abspath(path)), example["image"])
+                examples.append(example)
+    return examples
+
+
+def is_quantized(model):
+    return any(isinstance(module, quantized_dynamic.Linear) for module in model.modules())
+
+
+def _fingerprint(*paths):
+    parts = [torch.__version__, str(QUANTIZE_MAX_EXTRA_ERRORS)]
+    for path in paths:
+        stat = os.stat(path) if os.path.exists(path) else None
+        parts.append(f"{stat.st_size}:{stat.st_mtime_ns}" if stat else "-")
+    return "|".join(parts)
+
+
+def _quantize(model):
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def _cached_model(cache_path, fingerprint, build_model):
+    """(model, decision) from the cache: the int8 model or None if it was
+    rejected. None when there is no usable cache for this fingerprint."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        cached = torch.load(cache_path, map_location="cpu", weights_only=True)
+        if cached["fingerprint"] != fingerprint:
+            return None
+        if cached["state_dict"] is None:
+            return None, cached
+        model = _quantize(build_model())
+        model.load_state_dict(cached["state_dict"])
+        return model, cached
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable {cache_path} ({str(e)})")
+        return None
+
+
+def load_model(weights_path, build_model, holdout_errors, device, holdout_path):
+    """Build a model, or its int8 dynamic-quantized form when QUANTIZE=1.
+
+    Every nn.Linear is quantized to int8 (CPU only). holdout_errors(model)
+    returns (errors, examples) on the held-out set, or None when it has no
+    examples for this model; such a model is never quantized, which is the
+    case for the image model until labelled images are added to the set.
+    The quantized model is kept only if it makes at most
+    QUANTIZE_MAX_EXTRA_ERRORS more errors than the float model. The
+    decision and the int8 state_dict are cached next to the weights as
+    <name>.int8.pt, so later startups skip validation.
+    """
+    if not QUANTIZE or device.type != "cpu":
+        return build_model()
+
+    cache_path = os.path.splitext(weights_path)[0] + ".int8.pt"
+    fingerprint = _fingerprint(weights_path, holdout_path)
+    cached = _cached_model(cache_path, fingerprint, build_model)
+    if cached is not None:
+        model, decision = cached
+        if model is not None:
+            print(f"✅ Loaded cached int8 model {cache_path}")
+            return model
+        print(f"⚠️ int8 {weights_path} was rejected ({decision['reason']}), using float weights")
+        return build_model()
+
+    model = build_model()
+    baseline = holdout_errors(model)
+    if baseline is None:
+        print(f"⚠️ No held-out examples for {weights_path}, not quantizing")
+        return model
+
+    quantized = _quantize(model)
+    errors, examples = holdout_errors(quantized)
+    reason = None
+    if errors - baseline[0] > QUANTIZE_MAX_EXTRA_ERRORS:
+        reason = f"{errors}/{examples} held-out errors vs {baseline[0]} in float"
+
+    torch.save({
+        "fingerprint": fingerprint,
+        "state_dict": None if reason else quantized.state_dict(),
+        "reason": reason,
+        "errors": errors,
+        "baseline": baseline[0],
+        "examples": examples
+    }, cache_path)
+
+    if reason:
+        print(f"⚠️ int8 {weights_path} rejected ({reason}), using float weights")
+        return model
+    print(f"✅ Quantized {weights_path} to int8 ({errors}/{examples} held-out errors vs {baseline[0]} in float)")
+    return quantized
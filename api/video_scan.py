@@ -0,0 +1,82 @@
+# video_scan.py - Keyframe sampling and moderation for uploaded shorts
+import av
+import numpy as np
+
+
+def sample_frames(path, fps=1.0, scene_threshold=None, keyframes_only=False, size=224):
+    """Yield (timestamp, PIL image) for sampled frames, decoding lazily.
+
+    A frame is taken every 1/fps seconds and, when scene_threshold is set,
+    whenever the mean absolute difference of a 64x36 grayscale thumbnail
+    against the previous frame exceeds it (0-255 scale). With
+    keyframes_only the decoder skips every non-key frame. Frames are scaled
+    to size x size by the decoder, so full-resolution RGB is never built.
+    """
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        if keyframes_only:
+            stream.codec_context.skip_frame = "NONKEY"
+
+        next_time = 0.0
+        previous = None
+        for frame in container.decode(stream):
+            if frame.time is None:
+                continue
+            take = frame.time >= next_time
+
+            if scene_threshold is not None:
+                thumbnail = frame.to_ndarray(width=64, height=36, format="gray").astype(np.int16)
+                if previous is not None and np.abs(thumbnail - previous).mean() > scene_threshold:
+                    take = True
+                previous = thumbnail
+
+            if take:
+                next_time = frame.time + 1 / fps
+                yield float(frame.time), frame.to_image(width=size, height=size)
+
+
+def scan_video(frames, classify_images, batch_size=16, flag_threshold=0.5, stop_confidence=0.95):
+    """Classify sampled frames in batches and aggregate a per-video verdict.
+
+    classify_images takes a list of PIL images and returns prediction dicts.
+    Scanning stops at the first frame whose cyberbullying probability
+    reaches stop_confidence; the rest of the video is never decoded.
+    """
+    scanned = 0
+    max_score = 0.0
+    offending = []
+    stopped_early = False
+    batch = []
+
+    def classify(batch):
+        nonlocal scanned, max_score, stopped_early
+        for (timestamp, _), result in zip(batch, classify_images([image for _, image in batch])):
+            scanned += 1
+            # Prediction score is the confidence of the predicted class
+            score = result["score"] if result["isCyberbullying"] else 1 - result["score"]
+            max_score = max(max_score, score)
+            if score >= flag_threshold:
+                offending.append({"timestamp": round(timestamp, 3), "score": float(score)})
+            if score >= stop_confidence:
+                stopped_early = True
+
+    for item in frames:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            classify(batch)
+            batch = []
+            if stopped_early:
+                break
+    if batch and not stopped_early:
+        classify(batch)
+
+    is_cyberbullying = max_score >= flag_threshold
+    return {
+        "isCyberbullying": is_cyberbullying,
+        "score": float(max_score),
+        "prediction": "cyberbullying" if is_cyberbullying else "non_cyberbullying",
+        "framesScanned": scanned,
+        "stoppedEarly": stopped_early,
+        "offendingFrames": offending
+    }
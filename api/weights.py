@@ -0,0 +1,62 @@
+# weights.py - Memory-mapped safetensors weights, with the .pth files as fallback
+#   python weights.py text_model.pth image_model.pth
+# writes text_model.safetensors and image_model.safetensors next to them.
+import os
+import sys
+import torch
+from safetensors.torch import load_file, save_file
+
+
+def weights_file(pth_path):
+    """The .safetensors export of pth_path if there is one, else pth_path"""
+    path = os.path.splitext(pth_path)[0] + ".safetensors"
+    return path if os.path.exists(path) else pth_path
+
+
+def load_weights(build_model, pth_path, device):
+    """Build a model and load its weights, preferring the safetensors export.
+
+    A safetensors file is mapped rather than read, and the mapped tensors
+    replace the freshly initialized parameters instead of being copied into
+    them, so on CPU the weights stay in the page cache and every worker
+    process on the node shares one copy. No pickle is involved.
+    """
+    path = weights_file(pth_path)
+    model = build_model()
+    if not path.endswith(".safetensors"):
+        model.load_state_dict(torch.load(path, map_location=device))
+        return model
+
+    state_dict = load_file(path, device=str(device))
+    # Tied weights are stored once, so their alias names are reported missing
+    result = model.load_state_dict(state_dict, strict=False, assign=True)
+    loaded = {tensor.data_ptr() for tensor in state_dict.values()}
+    current = model.state_dict(keep_vars=True)
+    missing = [name for name in result.missing_keys if current[name].data_ptr() not in loaded]
+    if missing:
+        raise ValueError(f"{path} has no weights for {', '.join(missing)}")
+    return model
+
+
+def convert(pth_path):
+    state_dict = torch.load(pth_path, map_location="cpu", weights_only=True)
+    tensors = {}
+    seen = set()
+    for name, tensor in state_dict.items():
+        # safetensors refuses shared storage; keep the first name of a tied weight
+        key = (tensor.untyped_storage().data_ptr(), tensor.storage_offset(), tuple(tensor.shape))
+        if key not in seen:
+            seen.add(key)
+            tensors[name] = tensor.contiguous()
+
+    path = os.path.splitext(pth_path)[0] + ".safetensors"
+    save_file(tensors, path, metadata={"source": os.path.basename(pth_path)})
+    print(f"✅ {pth_path} -> {path} ({len(tensors)} tensors)")
+    return path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python weights.py MODEL.pth [MODEL.pth ...]")
+    for pth_path in sys.argv[1:]:
+        convert(pth_path)
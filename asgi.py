@@ -0,0 +1,235 @@
+# asgi.py - ASGI serving mode for the Flask apps
+#   uvicorn asgi:app --workers 2                      (minimal_api)
+#   ASGI_APP=flask_api uvicorn asgi:app --workers 2   (from api/)
+# Same endpoints and JSON as under gunicorn. The event loop reads request
+# bodies and writes responses, so slow clients cost a coroutine rather than
+# a worker; the Flask views run on a bounded thread pool. Streaming routes
+# read their upload as it arrives, which holds a thread for as long as the
+# client takes to send it, so they run on a separate, smaller pool and slow
+# uploaders cannot starve the other routes.
+import asyncio
+import contextvars
+import importlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+ASGI_APP = os.environ.get("ASGI_APP", "minimal_api")
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", "8"))
+# Requests beyond this many (running or waiting for a thread) get a 503 at
+# once instead of queueing until every one of them times out
+ASGI_MAX_PENDING = int(os.environ.get("ASGI_MAX_PENDING", str(ASGI_THREADS * 8)))
+ASGI_MAX_BODY_BYTES = int(os.environ.get("ASGI_MAX_BODY_MB", "100")) * 1024 * 1024
+# Routes that consume their body incrementally (NDJSON uploads) get it as it
+# arrives, with no size cap, rather than after it has been buffered
+ASGI_STREAMING_PATHS = {path.strip() for path in os.environ.get("ASGI_STREAMING_PATHS", "/api/stream-detect").split(",")
+                        if path.strip()}
+ASGI_STREAM_THREADS = int(os.environ.get("ASGI_STREAM_THREADS", "4"))
+ASGI_STREAM_MAX_PENDING = int(os.environ.get("ASGI_STREAM_MAX_PENDING", str(ASGI_STREAM_THREADS * 2)))
+
+
+class WorkerPool:
+    """A bounded thread pool and the requests admitted to it"""
+
+    def __init__(self, threads, max_pending, name):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=name)
+        self.max_pending = max_pending
+        self.pending = 0
+
+
+class StreamingBody:
+    """wsgi.input that pulls the request body from the ASGI connection as
+    the app reads it, so nothing is buffered beyond the current chunk and a
+    slow reader holds back the upload"""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = bytearray()
+        self._more = True
+
+    def _fill(self):
+        # Runs on the app's thread; receive() itself runs on the event loop
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message["type"] == "http.disconnect":
+            raise OSError("Client disconnected during upload")
+        self._buffer += message.get("body", b"")
+        self._more = message.get("more_body", False)
+
+    def _take(self, size):
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def read(self, size=-1):
+        while self._more and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        return self._take(len(self._buffer) if size is None or size < 0 else size)
+
+    def readline(self, size=-1):
+        limit = None if size is None or size < 0 else size
+        while self._more and b"\n" not in self._buffer and (limit is None or len(self._buffer) < limit):
+            self._fill()
+        end = self._buffer.find(b"\n") + 1 or len(self._buffer)
+        return self._take(end if limit is None else min(end, limit))
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+
+class AsgiApp:
+    """Runs a WSGI app under an ASGI server on bounded thread pools: one for
+    buffered requests and one for streaming_paths"""
+
+    def __init__(self, wsgi_app, threads=ASGI_THREADS, max_pending=ASGI_MAX_PENDING,
+                 stream_threads=ASGI_STREAM_THREADS, stream_max_pending=ASGI_STREAM_MAX_PENDING,
+                 streaming_paths=ASGI_STREAMING_PATHS):
+        self.wsgi_app = wsgi_app
+        self.pool = WorkerPool(threads, max_pending, "asgi")
+        self.stream_pool = WorkerPool(stream_threads, stream_max_pending, "asgi-stream")
+        self.streaming_paths = streaming_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.pool.executor.shutdown(wait=False)
+                self.stream_pool.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        if scope["path"] in self.streaming_paths:
+            body = StreamingBody(receive, asyncio.get_running_loop())
+            await self._admit(self.stream_pool, scope, body, None, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > ASGI_MAX_BODY_BYTES:
+            await self._error(send, 413, "Request too large")
+            return
+        with SpooledTemporaryFile(max_size=1024 * 1024) as body:
+            size = 0
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size > ASGI_MAX_BODY_BYTES:
+                    await self._error(send, 413, "Request too large")
+                    return
+                body.write(chunk)
+                if not message.get("more_body"):
+                    break
+            body.seek(0)
+            await self._admit(self.pool, scope, body, size, send)
+
+    async def _admit(self, pool, scope, body, size, send):
+        if pool.pending >= pool.max_pending:
+            await self._error(send, 503, "Server busy, retry shortly", [(b"retry-after", b"1")])
+            return
+        pool.pending += 1
+        try:
+            await self._run_wsgi(pool.executor, scope, body, size, send)
+        finally:
+            pool.pending -= 1
+
+    async def _run_wsgi(self, executor, scope, body, size, send):
+        loop = asyncio.get_running_loop()
+        # Each step of the response runs on whichever pool thread is free,
+        # always inside the request's own context so Flask's request context
+        # (and stream_with_context generators) carry across threads
+        context = contextvars.copy_context()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers]
+
+        def run(func, *args):
+            return loop.run_in_executor(executor, context.run, func, *args)
+
+        environ = self._environ(scope, body, size)
+        iterable = await run(self.wsgi_app, environ, start_response)
+        try:
+            chunks = iter(iterable)
+            response_sent = False
+            while True:
+                chunk = await run(next, chunks, None)
+                if not response_sent:
+                    await send({"type": "http.response.start", "status": started["status"],
+                                "headers": started["headers"]})
+                    response_sent = True
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body"})
+        finally:
+            if hasattr(iterable, "close"):
+                await run(iterable.close)
+
+    @staticmethod
+    def _environ(scope, body, size):
+        script_name = scope.get("root_path", "").encode("utf8").decode("latin1")
+        path_info = scope["path"].encode("utf8").decode("latin1")
+        if path_info.startswith(script_name):
+            path_info = path_info[len(script_name):]
+        server = scope.get("server") or ("localhost", 80)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": script_name,
+            "PATH_INFO": path_info,
+            "QUERY_STRING": scope["query_string"].decode("ascii"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+            "REMOTE_ADDR": (scope.get("client") or ("",))[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.input_terminated": True,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False
+        }
+        if size is not None:
+            # The body is fully read by now, whatever the transfer encoding
+            environ["CONTENT_LENGTH"] = str(size)
+        for name, value in scope["headers"]:
+            name = name.decode("latin1").upper().replace("-", "_")
+            if name == "CONTENT_LENGTH":
+                continue
+            key = name if name == "CONTENT_TYPE" else f"HTTP_{name}"
+            value = value.decode("latin1")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    @staticmethod
+    async def _error(send, status, message, headers=()):
+        body = json.dumps({"error": message}).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"), *headers]})
+        await send({"type": "http.response.body", "body": body})
+
+
+app = AsgiApp(importlib.import_module(ASGI_APP).app)
@@ -0,0 +1,416 @@
+# bench.py - Reproducible benchmarks for the rule engine and the model endpoints
+#
+#   python benchmarks/bench.py                                  # rule engine cases, in-process
+#   python benchmarks/bench.py --cases model --models-dir .     # predict_text / predict_image_base64
+#   python benchmarks/bench.py --cases http --url http://localhost:5000 \
+#       --model-url http://localhost:5001 --concurrency 16
+#   python benchmarks/bench.py --out after.json --baseline before.json
+#
+# Every case runs in a fresh subprocess on a corpus generated from --seed, so
+# peak RSS is the case's own and two runs with the same arguments see the
+# same inputs. With --baseline the run exits 1 when any case is slower (or
+# bigger) than the baseline by more than the tolerances.
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(ROOT, "api")
+
+NEUTRAL_WORDS = (
+    "the a and to of in is it you that this for on with was are be have not but "
+    "what so just like out if about get all my your one they we can do go there "
+    "video great love thanks lol really good nice song music game first time "
+    "watch people think know see would make more when how new day best never "
+    "always still much better world year work play part song again right here"
+).split()
+EMOJI = ["😂", "🔥", "❤️", "👍", "😭", "🙄", "💀", "✨"]
+
+CASE_GROUPS = {
+    "rules": ["detect_cyberbullying", "api_detect", "api_batch_detect"],
+    "model": ["predict_text", "predict_image_base64"],
+    "http": ["http_detect", "http_batch_detect", "http_detect_text", "http_detect_image"]
+}
+
+
+# ========== CORPUS ==========
+def lexicon_words():
+    with open(os.path.join(ROOT, "lexicon.json"), encoding="utf-8") as f:
+        patterns = json.load(f)["patterns"]
+    return sorted(word for entry in patterns.values() for word in entry.get("words", []))
+
+
+def make_corpus(n, seed, toxic_rate, duplicate_rate):
+    """Synthetic comments: log-normal word counts (median ~10, capped at
+    300), toxic_rate of them carrying lexicon words, duplicate_rate of them
+    repeating an earlier comment with a bias towards the first (popular) ones,
+    and a sprinkling of shouting, punctuation runs and emoji"""
+    rng = random.Random(seed)
+    toxic = lexicon_words()
+    texts = []
+    for _ in range(n):
+        if texts and rng.random() < duplicate_rate:
+            texts.append(texts[int(len(texts) * rng.random() ** 3)])
+            continue
+        length = max(1, min(300, int(rng.lognormvariate(2.3, 0.9))))
+        words = [rng.choice(NEUTRAL_WORDS) for _ in range(length)]
+        if rng.random() < toxic_rate:
+            for _ in range(rng.choice((1, 1, 1, 2, 3))):
+                words.insert(rng.randrange(len(words) + 1), rng.choice(toxic))
+        text = " ".join(words)
+        style = rng.random()
+        if style < 0.05:
+            text = text.upper()
+        elif style < 0.15:
+            text += rng.choice(("!", "!!!", "?", "?!", "..."))
+        if rng.random() < 0.1:
+            text += " " + rng.choice(EMOJI)
+        texts.append(text)
+    return texts
+
+
+def make_images(n, seed):
+    """Base64 JPEGs of typical upload sizes: smooth gradients plus noise"""
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    sizes = [(320, 240), (640, 480), (1080, 1080), (1920, 1080)]
+    images = []
+    for i in range(n):
+        width, height = sizes[i % len(sizes)]
+        gradient = np.linspace(0, 255, width)[None, :, None] * rng.random(3)[None, None, :]
+        pixels = np.clip(gradient + rng.normal(0, 20, (height, width, 3)), 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+        images.append(base64.b64encode(buffer.getvalue()).decode())
+    return images
+
+
+# ========== CASES ==========
+# Each case returns (per-call latencies in seconds, items processed, wall seconds)
+def timed_calls(calls):
+    latencies = []
+    started = time.perf_counter()
+    for call in calls:
+        t = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - started
+
+
+def concurrent_calls(calls, concurrency):
+    def run(call):
+        t = time.perf_counter()
+        call()
+        return time.perf_counter() - t
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(run, calls))
+    return latencies, time.perf_counter() - started
+
+
+def post_json(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=300) as response:
+        if response.status != 200:
+            raise RuntimeError(f"{url} answered {response.status}")
+        return response.read()
+
+
+def batches(texts, size):
+    return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+
+def case_detect_cyberbullying(args):
+    sys.path.insert(0, ROOT)
+    import minimal_api
+    texts = make_corpus(args.n, args.seed, args.toxic_rate, args.duplicate_rate)
+    for text in texts[:args.warmup]:
+        minimal_api.detect_cyberbullying(text)
+    latencies, elapsed = timed_calls(lambda text=text: minimal_api.detect_cyberbullying(text) for text in texts)
+    return latencies, len(texts), elapsed
+
+
+def case_api_detect(args):
+    sys.path.insert(0, ROOT)
+    import minimal_api
+    client = minimal_api.app.test_client()
+    texts = make_corpus(args.n, args.seed, args.toxic_rate, args.duplicate_rate)
+    latencies, elapsed = timed_calls(
+        lambda text=text: client.post("/api/detect", json={"text": text}).close() for text in texts)
+    return latencies, len(texts), elapsed
+
+
+def case_api_batch_detect(args):
+    sys.path.insert(0, ROOT)
+    import minimal_api
+    client = minimal_api.app.test_client()
+    texts = make_corpus(args.n, args.seed, args.toxic_rate, args.duplicate_rate)
+    latencies, elapsed = timed_calls(
+        lambda chunk=chunk: client.post("/api/batch-detect", json={"texts": chunk}).get_data()
+        for chunk in batches(texts, args.batch_size))
+    return latencies, len(texts), elapsed
+
+
+def load_flask_api(args):
+    sys.path.insert(0, API_DIR)
+    os.chdir(args.models_dir)
+    import flask_api
+    return flask_api
+
+
+def case_predict_text(args):
+    flask_api = load_flask_api(args)
+    texts = make_corpus(args.model_n, args.seed, args.toxic_rate, args.duplicate_rate)
+    for text in texts[:args.warmup]:
+        flask_api.predict_text(text)
+    latencies, elapsed = timed_calls(lambda text=text: flask_api.predict_text(text) for text in texts)
+    return latencies, len(texts), elapsed
+
+
+def case_predict_image_base64(args):
+    flask_api = load_flask_api(args)
+    images = make_images(args.images, args.seed)
+    flask_api.predict_image_base64(images[0])
+    latencies, elapsed = timed_calls(lambda image=image: flask_api.predict_image_base64(image) for image in images)
+    return latencies, len(images), elapsed
+
+
+def case_http_detect(args):
+    texts = make_corpus(args.n, args.seed, args.toxic_rate, args.duplicate_rate)
+    url = args.url + "/api/detect"
+    latencies, elapsed = concurrent_calls(
+        [lambda text=text: post_json(url, {"text": text}) for text in texts], args.concurrency)
+    return latencies, len(texts), elapsed
+
+
+def case_http_batch_detect(args):
+    texts = make_corpus(args.n, args.seed, args.toxic_rate, args.duplicate_rate)
+    url = args.url + "/api/batch-detect"
+    latencies, elapsed = concurrent_calls(
+        [lambda chunk=chunk: post_json(url, {"texts": chunk}) for chunk in batches(texts, args.batch_size)],
+        args.concurrency)
+    return latencies, len(texts), elapsed
+
+
+def case_http_detect_text(args):
+    texts = make_corpus(args.model_n, args.seed, args.toxic_rate, args.duplicate_rate)
+    url = args.model_url + "/api/detect/text"
+    latencies, elapsed = concurrent_calls(
+        [lambda text=text: post_json(url, {"text": text}) for text in texts], args.concurrency)
+    return latencies, len(texts), elapsed
+
+
+def case_http_detect_image(args):
+    images = make_images(args.images, args.seed)
+    url = args.model_url + "/api/detect/image"
+    latencies, elapsed = concurrent_calls(
+        [lambda image=image: post_json(url, {"image": image}) for image in images], args.concurrency)
+    return latencies, len(images), elapsed
+
+
+CASES = {
+    "detect_cyberbullying": case_detect_cyberbullying,
+    "api_detect": case_api_detect,
+    "api_batch_detect": case_api_batch_detect,
+    "predict_text": case_predict_text,
+    "predict_image_base64": case_predict_image_base64,
+    "http_detect": case_http_detect,
+    "http_batch_detect": case_http_batch_detect,
+    "http_detect_text": case_http_detect_text,
+    "http_detect_image": case_http_detect_image
+}
+
+
+def server_peak_rss_mb(pid):
+    """High-water RSS of a local server process, for the HTTP cases"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return None
+
+
+def run_case(name, args):
+    latencies, items, elapsed = CASES[name](args)
+    latencies_ms = np.array(latencies) * 1000
+    result = {
+        "calls": len(latencies),
+        "items": items,
+        "seconds": round(elapsed, 3),
+        "throughput": round(items / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+    if name.startswith("http_") and args.server_pid:
+        result["server_peak_rss_mb"] = server_peak_rss_mb(args.server_pid)
+    return result
+
+
+# ========== RUNNER ==========
+def case_names(spec):
+    names = []
+    for part in spec.split(","):
+        if part == "all":
+            names += [name for group in ("rules", "model") for name in CASE_GROUPS[group]]
+        else:
+            names += CASE_GROUPS.get(part, [part])
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        sys.exit(f"Unknown benchmark case(s): {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+
+def run_isolated(name, argv):
+    """Run one case in a fresh interpreter and return its result dict"""
+    with tempfile.NamedTemporaryFile(suffix=".json") as f:
+        command = [sys.executable, os.path.abspath(__file__), *argv, "--run-case", name, "--result-file", f.name]
+        process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if process.returncode != 0:
+            return {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "failed"}
+        return json.load(open(f.name))
+
+
+def run_repeated(name, argv, repeat):
+    """Best of repeat isolated runs (highest throughput), the usual way to
+    keep scheduler noise out of the comparison"""
+    runs = []
+    for _ in range(repeat):
+        result = run_isolated(name, argv)
+        if "error" in result:
+            return result
+        runs.append(result)
+    best = max(runs, key=lambda result: result["throughput"])
+    return {**best, "runs": [result["throughput"] for result in runs]}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, args):
+    """Regressions against a baseline run, as printable strings. A case
+    that failed, or a baseline case this run did not produce, counts as one"""
+    if baseline["corpus"] != results["corpus"]:
+        return [f"corpus differs from the baseline ({baseline['corpus']} vs {results['corpus']}); not comparable"]
+    regressions = [f"{name}: in the baseline but not run" for name in baseline["results"]
+                   if name not in results["results"]]
+    for name, result in results["results"].items():
+        if "error" in result:
+            regressions.append(f"{name}: failed ({result['error']})")
+            continue
+        base = baseline["results"].get(name)
+        if not base or "throughput" not in base:
+            continue
+        checks = [
+            ("throughput", result["throughput"] < base["throughput"] * (1 - args.tolerance)),
+            ("p50_ms", result["p50_ms"] > base["p50_ms"] * (1 + args.tolerance)),
+            ("p99_ms", result["p99_ms"] > base["p99_ms"] * (1 + args.p99_tolerance)),
+            ("peak_rss_mb", result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + args.rss_tolerance))
+        ]
+        for metric, regressed in checks:
+            if regressed:
+                regressions.append(f"{name}: {metric} {base[metric]} -> {result[metric]}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the rule engine and model endpoints")
+    parser.add_argument("--cases", default="rules",
+                        help="comma-separated cases or groups (rules, model, http, all); default: rules")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--n", type=int, default=5000, help="texts for the rule engine cases")
+    parser.add_argument("--model-n", type=int, default=200, help="texts for the text model cases")
+    parser.add_argument("--images", type=int, default=40, help="images for the image model cases")
+    parser.add_argument("--toxic-rate", type=float, default=0.15)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--batch-size", type=int, default=500, help="texts per /api/batch-detect request")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the best one is reported")
+    parser.add_argument("--models-dir", default=os.getcwd(), help="directory holding text_model.pth etc.")
+    parser.add_argument("--url", default="http://localhost:5000", help="minimal_api server for HTTP cases")
+    parser.add_argument("--model-url", default="http://localhost:5001", help="flask_api server for HTTP cases")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients for HTTP cases")
+    parser.add_argument("--server-pid", type=int, help="local server pid, to report its peak RSS")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed throughput / p50 change")
+    parser.add_argument("--p99-tolerance", type=float, default=0.25)
+    parser.add_argument("--rss-tolerance", type=float, default=0.15)
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    args.models_dir = os.path.abspath(args.models_dir)
+
+    if args.run_case:
+        with open(args.result_file, "w") as f:
+            json.dump(run_case(args.run_case, args), f)
+        return
+
+    argv = sys.argv[1:]
+    results = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "corpus": {
+            "seed": args.seed, "n": args.n, "model_n": args.model_n, "images": args.images,
+            "toxic_rate": args.toxic_rate, "duplicate_rate": args.duplicate_rate, "batch_size": args.batch_size
+        },
+        "repeat": args.repeat,
+        "env": {key: value for key, value in os.environ.items()
+                if key.startswith(("BATCH_", "DETECTION_CACHE", "TEXT_", "IMAGE_", "QUANTIZE", "MODEL"))},
+        "results": {}
+    }
+
+    print(f"{'case':<20}{'items/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'rss MB':>10}")
+    for name in case_names(args.cases):
+        result = run_repeated(name, argv, args.repeat)
+        results["results"][name] = result
+        if "error" in result:
+            print(f"{name:<20}  failed: {result['error']}")
+        else:
+            print(f"{name:<20}{result['throughput']:>12}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+                  f"{result['peak_rss_mb']:>10}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args)
+        if regressions:
+            print("REGRESSIONS against " + args.baseline)
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Tests for asgi.AsgiApp, driven directly through the ASGI interface
+#   python -m pytest tests
+import asyncio
+import json
+import os
+import sys
+
+from flask import Flask, Response, jsonify, request, stream_with_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asgi
+from asgi import AsgiApp
+
+flask_app = Flask(__name__)
+
+
+@flask_app.route('/echo', methods=['POST'])
+def echo():
+    body = request.get_data()
+    return jsonify({'length': len(body), 'contentLength': request.content_length, 'body': body.decode()})
+
+
+@flask_app.route('/lines')
+def lines():
+    def generate():
+        # Needs the request context on whichever thread runs this step
+        for i in range(int(request.args['n'])):
+            yield f'{i}\n'
+    return Response(stream_with_context(generate()), mimetype='text/plain')
+
+
+@flask_app.route('/stream', methods=['POST'])
+def stream():
+    def generate():
+        for line in request.stream:
+            yield json.dumps({'line': line.decode().strip()}) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def scope(method, path, headers=(), query=b''):
+    return {'type': 'http', 'http_version': '1.1', 'method': method, 'path': path, 'root_path': '',
+            'query_string': query, 'headers': list(headers), 'server': ('test', 80), 'client': ('127.0.0.1', 1)}
+
+
+async def call(app, method, path, chunks=(), headers=(), query=b'', gate=None):
+    """(status, headers, body) of one request; the body goes in as chunks,
+    and a receive after the first chunk waits for gate when given"""
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)] or [{'type': 'http.request', 'body': b''}]
+    sent = []
+
+    async def receive():
+        if gate is not None and len(messages) < len(chunks):
+            await gate.wait()
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope(method, path, headers, query), receive, send)
+    start = sent[0]
+    assert all(message['type'] == 'http.response.body' for message in sent[1:])
+    assert not sent[-1].get('more_body')
+    return start['status'], dict(start['headers']), b''.join(message.get('body', b'') for message in sent[1:])
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+
+def test_buffered_body():
+    app = AsgiApp(flask_app, streaming_paths={'/stream'})
+    status, _, body = run(call(app, 'POST', '/echo', [b'hello world'], [(b'content-length', b'11')]))
+    assert status == 200
+    assert json.loads(body) == {'length': 11, 'contentLength': 11, 'body': 'hello world'}
+
+
+def test_chunked_body_gets_its_length():
+    app = AsgiApp(flask_app, streaming_paths={'/stream'})
+    status, _, body = run(call(app, 'POST', '/echo', [b'ab', b'', b'cde']))
+    assert status == 200
+    assert json.loads(body) == {'length': 5, 'contentLength': 5, 'body': 'abcde'}
+
+
+def test_too_large(monkeypatch):
+    monkeypatch.setattr(asgi, 'ASGI_MAX_BODY_BYTES', 4)
+    app = AsgiApp(flask_app, streaming_paths={'/stream'})
+    # Declared up front, and discovered while reading a chunked body
+    status, _, body = run(call(app, 'POST', '/echo', [b'hello'], [(b'content-length', b'5')]))
+    assert (status, json.loads(body)) == (413, {'error': 'Request too large'})
+    status, _, _ = run(call(app, 'POST', '/echo', [b'abc', b'de']))
+    assert status == 413
+    # Streaming routes have no cap
+    status, _, _ = run(call(app, 'POST', '/stream', [b'hello\n', b'world\n']))
+    assert status == 200
+
+
+def test_busy():
+    app = AsgiApp(flask_app, stream_threads=1, stream_max_pending=1, streaming_paths={'/stream'})
+
+    async def scenario():
+        gate = asyncio.Event()
+        slow = asyncio.ensure_future(call(app, 'POST', '/stream', [b'a\n', b'b\n'], gate=gate))
+        await asyncio.sleep(0.1)
+        status, headers, _ = await call(app, 'POST', '/stream', [b'c\n'])
+        gate.set()
+        return status, headers, await slow
+
+    status, headers, (slow_status, _, _) = run(scenario())
+    assert (status, headers[b'retry-after']) == (503, b'1')
+    assert slow_status == 200
+
+
+def test_slow_uploads_leave_other_routes_free():
+    app = AsgiApp(flask_app, threads=1, stream_threads=2, streaming_paths={'/stream'})
+
+    async def scenario():
+        gate = asyncio.Event()
+        uploads = [asyncio.ensure_future(call(app, 'POST', '/stream', [b'a\n', b'b\n'], gate=gate))
+                   for _ in range(2)]
+        await asyncio.sleep(0.1)
+        # Both streaming threads wait on their clients; /echo still runs
+        other = await call(app, 'POST', '/echo', [b'x'])
+        assert not any(upload.done() for upload in uploads)
+        gate.set()
+        return other, await asyncio.gather(*uploads)
+
+    (status, _, _), uploads = run(scenario())
+    assert status == 200
+    for upload_status, _, body in uploads:
+        assert upload_status == 200
+        assert [json.loads(line)['line'] for line in body.splitlines()] == ['a', 'b']
+
+
+def test_streamed_response():
+    app = AsgiApp(flask_app, streaming_paths={'/stream'})
+    status, headers, body = run(call(app, 'GET', '/lines', query=b'n=50'))
+    assert status == 200
+    assert headers[b'content-type'].startswith(b'text/plain')
+    assert body.decode().split() == [str(i) for i in range(50)]
+
+
+def test_streaming_body_reads_lines_across_chunks():
+    app = AsgiApp(flask_app, streaming_paths={'/stream'})
+    status, _, body = run(call(app, 'POST', '/stream', [b'{"te', b'xt": 1}\nsecond', b' line\n', b'last']))
+    assert status == 200
+    assert [json.loads(line)['line'] for line in body.splitlines()] == ['{"text": 1}', 'second line', 'last']
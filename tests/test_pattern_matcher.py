@@ -0,0 +1,101 @@
+# Tests for minimal_api.PatternMatcher against a brute-force regex oracle
+#   python -m pytest tests
+import json
+import os
+import random
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from minimal_api import PatternMatch, PatternMatcher, load_lexicon, LEXICON_PATH
+
+
+def brute_force(patterns, text):
+    """Every (entry, start) where the entry's own regex matches the full text"""
+    entries = []
+    for category, data in patterns.items():
+        entries += [(category, 'word', word) for word in data.get('words', [])]
+        entries += [(category, 'pattern', pattern) for pattern in data.get('patterns', [])]
+
+    found = []
+    for i, (category, kind, phrase) in enumerate(entries):
+        regex = re.compile(phrase if kind == 'pattern' else r'(?<!\w)' + re.escape(phrase) + r'(?!\w)')
+        for start in range(len(text) + 1):
+            m = regex.match(text, start)
+            if m:
+                found.append((start, i, PatternMatch(category, kind, phrase, start, m.end())))
+    return [match for _, _, match in sorted(found)]
+
+
+def check(patterns, texts):
+    matcher = PatternMatcher(patterns)
+    for text in texts:
+        assert matcher.find_all(text) == brute_force(patterns, text), text
+
+
+def test_word_and_overlapping_pattern():
+    patterns = {'hate_speech': {'words': ['you suck at'], 'patterns': [r'\byou suck\b']}}
+    check(patterns, ['you suck at this', 'you suck', 'yousuck at', 'you suck atheist'])
+    phrases = [m.phrase for m in PatternMatcher(patterns).find_all('you suck at this')]
+    assert phrases == ['you suck at', r'\byou suck\b']
+
+
+def test_lookarounds_and_open_ended_patterns():
+    patterns = {
+        'insults': {'patterns': [r'(?<=big )loser', r'\bidiot(?= forever)', r'\bidiots?', r'clown|\bjoke\b']},
+        'harassment': {'words': ['idiot', 'big']}
+    }
+    check(patterns, [
+        'what a big loser', 'a loser', 'idiot forever', 'idiot for ever', 'so idiotic', 'idiots!',
+        'clowning around', 'a joke', 'jokes', 'bigidiot', ''
+    ])
+    assert [m.phrase for m in PatternMatcher(patterns).find_all('so idiotic')] == [r'\bidiots?']
+
+
+def test_bundled_lexicon():
+    patterns = load_lexicon(LEXICON_PATH).patterns
+    check(patterns, [
+        "you're stupid and ugly, kill yourself",
+        "i hate you, you suck at this game. shut up!",
+        "killing time at the skinny jeans store, not fat at all",
+        "nobody loves you nobody loves you",
+        "you are idiot idiot idiotic",
+        "Ünïcode text with kill and fat_cat and stupid-ish"
+    ])
+
+
+def test_random_lexicons():
+    rng = random.Random(0)
+    alphabet = 'ab _-'
+    for _ in range(200):
+        words = {''.join(rng.choice('ab ') for _ in range(rng.randint(1, 4))).strip() or 'a' for _ in range(4)}
+        pattern_pool = [r'\ba+b', r'(?<=b )a', r'a(?=b)', r'b+\b', r'\bab?', r'a b|\bb a']
+        patterns = {
+            'one': {'words': sorted(words)},
+            'two': {'words': sorted(words)[:1], 'patterns': rng.sample(pattern_pool, 3)}
+        }
+        texts = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 20))) for _ in range(10)]
+        check(patterns, texts)
+
+
+def test_patterns_scanned_on_their_own():
+    # Backreferences, inline flags and named groups lose their meaning or
+    # fail to compile inside the combined regex
+    patterns = {
+        'hate_speech': {'patterns': [r'\byou\'re (stupid|dumb)\b', r'(?P<word>\w+) (?P=word)']},
+        'spam': {'words': ['so'], 'patterns': [r'(\w)\1{3,}', r'(?i)\bspam', r'(?P<word>free)+']}
+    }
+    check(patterns, [
+        'soooooo good', "you're dumb dumb", 'SPAM spam', 'freefree money', 'so so', 'aaa', 'bb bbbb', ''
+    ])
+    assert [m.start for m in PatternMatcher(patterns).find_all('soooooo good')] == [1, 2, 3]
+
+
+def test_invalid_pattern_is_named(tmp_path):
+    path = tmp_path / 'lexicon.json'
+    path.write_text(json.dumps({'version': 1, 'patterns': {'spam': {'weight': 0.5, 'patterns': ['ok', '(unclosed']}}}))
+    with pytest.raises(ValueError, match=r"'spam' has an invalid pattern '\(unclosed'"):
+        load_lexicon(str(path))